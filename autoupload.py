@@ -2,24 +2,42 @@
 import re
 import os
 import sys
+import time
 import string
 import argparse
+import io
 import html
-from urllib.parse import urlparse
+import base64
+from urllib.parse import urlparse, urlencode
 import json
 import ftplib
+import contextlib
+import threading
+import atexit
+import unicodedata
+import functools
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-# Third-party packages
-import requests
-from bs4 import BeautifulSoup
-from mutagen.flac import FLAC
-from mutagen.mp3 import MP3
-from torf import Torrent
-from tqdm import tqdm
-from langdetect import detect
+## Third-party packages
+# bs4, mutagen, torf, tqdm and langdetect are imported by the functions that use them,
+# so --help, dry runs on cached releases and short lived runs from watch hooks don't pay for them.
 
 # JPS-AU files
 import jpspy
+import piecehash
+import tagindex
+import dictstore
+import ftptransfer
+import watchfolder
+import placement
+import releaseplan
+import uploadindex
+import journal
+import resolve
+import logindex
+import manifest
+import cover
+import profiler
 
 def asciiart ():
     print("""
@@ -32,56 +50,147 @@ def asciiart ():
 
 """)
 
+# Base url of the tracker, the benchmark points this at a local stand-in.
+jps_url = "https://jpopsuki.eu"
+
 # Get arguments using argparse
 def getargs():
     parser = argparse.ArgumentParser()
-    parser.add_argument('-dir', '--directory', help='Initiate upload on directory', nargs='?', required=True)
+    # Either upload the given directories or keep watching a folder for new releases.
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('-dir', '--directory', help='Initiate upload on directory, multiple directories will be uploaded as a batch', nargs='+')
+    source.add_argument("-w", "--watch", help="Keep running and upload every release that finishes landing in this folder")
+    source.add_argument("--apply", help="Upload the releases of a plan written by --dryrun, without reading tags or hashing again")
+    parser.add_argument("-b", "--batch", help="Treat every subdirectory of the given directories as a release", action="store_true")
+    parser.add_argument("-j", "--jobs", help="Number of releases processed at the same time in batch mode", type=int)
     parser.add_argument("-f", "--freeleech", help="Enables freeleech", action="store_true")
     parser.add_argument("-t", "--tags", help="Add additional tags to the upload", nargs='?')
     parser.add_argument('-d', '--debug', help='Enable debug mode', action='store_true')
     parser.add_argument("-dry", "--dryrun", help="Dryrun will carry out all actions other than the actual upload to JPS.", action="store_true")
+    parser.add_argument("--plan", help="File the dryrun writes its plan to, upload it later with --apply", default="upload_plan.json")
+    parser.add_argument("--restart", help="Start the given releases from scratch instead of resuming them from the job journal", action="store_true")
+    parser.add_argument("--allow-dupes", help="Upload even if the release was already uploaded from this machine or found on JPS", action="store_true")
+    parser.add_argument("--hash-workers", help="Number of processes used to hash torrent pieces (defaults to the number of cores)", type=int)
+    parser.add_argument("--no-hash-cache", help="Hash every piece again instead of using the piece cache", action="store_true")
+    parser.add_argument("--profile", help="Time every stage and sub-step, print a summary and write a Chrome trace (default profile_trace.json)", nargs='?', const='profile_trace.json')
+    parser.add_argument("--profile-stage", help="Also run cProfile on one stage", choices=['gatherdata', 'createtorrent', 'uploadtorrent', 'ftp_transfer', 'localfileorganization'])
 
     return parser.parse_args()
 
+## The announce URL (containing our passkey) is cached next to the session cache in cache/, which is never committed.
+# A warm run reuses it without requesting upload.php, it's refreshed after announce_ttl_seconds or a failed upload.
+def authkeycachefile():
+    return os.path.join(os.path.dirname(j.sessionFile), f"{urlparse(j.loginUrl).netloc}_announce.json")
+
+def invalidateauthkey():
+    try:
+        os.remove(authkeycachefile())
+    except FileNotFoundError:
+        pass
+
 # Acquire the authkey used for torrent files from upload.php
 def getauthkey():
-    uploadpage = j.retrieveContent("https://jpopsuki.eu/upload.php")
-    soup = BeautifulSoup(uploadpage.text, 'html5lib')
-    rel2 = str(soup.select('#wrapper #content .thin'))
-    # Regex returns multiple matches, could be optimized.
-    authkey = re.findall("(?<=value=\")(.*)(?=\")", rel2)[0]
+    ttl = cfg.get('cache_prefs', {}).get('announce_ttl_seconds', 24 * 60 * 60)
+    try:
+        with open(authkeycachefile()) as f:
+            cached = json.load(f)
+        if time.time() - cached['time'] < ttl:
+            return cached['announce']
+    except (FileNotFoundError, ValueError, KeyError):
+        pass
+
+    uploadpage = j.retrieveContent(f"{jps_url}/upload.php")
+    # The announce URL is the only input value ending in /announce, no need to build the DOM for it.
+    match = re.search(r'value="(https?://[^"]+/announce)"', uploadpage.text)
+    if match:
+        authkey = html.unescape(match.group(1))
+    else:
+        from bs4 import BeautifulSoup
+        soup = BeautifulSoup(uploadpage.text, 'html.parser')
+        authkey = soup.select_one('#wrapper #content .thin input[value]')['value']
+
+    if os.path.dirname(authkeycachefile()):
+        os.makedirs(os.path.dirname(authkeycachefile()), exist_ok=True)
+    with open(authkeycachefile(), 'w') as f:
+        json.dump({'announce': authkey, 'time': time.time()}, f)
 
     return authkey
 
-# Creates torrent file using torf module.
-def createtorrent(authkey, directory, filename, releasedata):
+## Searches JPS for the release and returns the titles of the torrent groups found.
+# Results are cached in the upload index for search_ttl_seconds so re-runs and batches don't repeat the search.
+def searchtracker(releasedata):
+    query = f"{releasedata['artist']} {releasedata['title']}"
+    ttl = cfg.get('dupe_prefs', {}).get('search_ttl_seconds', 24 * 60 * 60)
+    titles = upload_index.getsearch(query, ttl) if upload_index else None
+    if titles == None:
+        searchpage = j.retrieveContent(f"{jps_url}/torrents.php?{urlencode({'searchstr': query})}")
+        # Only links to torrent groups, links to the torrents within a group (&torrentid=) carry format/media text.
+        titles = [html.unescape(title).strip() for title in re.findall(r'<a href="torrents\.php\?id=\d+"[^>]*>([^<]+)</a>', searchpage.text)]
+        if upload_index:
+            upload_index.putsearch(query, titles)
+
+    return titles
+
+## Stops the upload of a release that was already uploaded, unless --allow-dupes was passed.
+# Before hashing the release is looked up by artist/title/format/media in the upload index,
+# once the torrent exists it's also looked up by info hash, which catches the same files under another name.
+# A torrent group with the same title on JPS only gives a warning, the search results don't tell whether
+# the group already has this format and media, so a FLAC of a group with only an MP3 is still uploaded.
+def checkdupe(releasedata, infohash=None):
+    if allow_dupes:
+        return
+
+    previous = upload_index.find(releasedata, infohash) if upload_index else None
+    if previous:
+        print("_" * 100)
+        print(f"Dupe: {releasedata['artist']} - {releasedata['title']} was already uploaded from {previous[0]} on {time.strftime('%Y-%m-%d %H:%M', time.localtime(previous[1]))}")
+        sys.exit()
+
+    if infohash == None and cfg.get('dupe_prefs', {}).get('search_tracker', False):
+        title = uploadindex.normalize(releasedata['title'])
+        if any(uploadindex.normalize(found) == title for found in searchtracker(releasedata)):
+            print("_" * 100)
+            print(f"Possible dupe: JPS already has a torrent group named {releasedata['title']}, check it has no {releasedata['media']} {releasedata['format']} torrent yet")
+
+## Creates the torrent using torf module and returns its filename and bencoded bytes.
+# The same bytes are POSTed, sent to the watch folders and, if save_torrent is enabled, written once to the CWD,
+# so nothing has to read the .torrent back from disk and batch workers don't race on the same file.
+def createtorrent(authkey, directory, filename, releasedata, release_manifest=None):
+    from torf import Torrent
+    from tqdm import tqdm
+
     t = Torrent(path=directory,
                 trackers=[authkey]) # Torf requires we store authkeys in a list object. This makes it easier to add multiple announce urls.
     # Set torrent to private as standard practice for private trackers
     t.private = True
-    t.generate()
+    # Pieces are hashed across hash_workers processes rather than torf's single core generate().
+    with tqdm(unit = 'pieces', leave = False, miniters = 1, desc = f'Hashing [{filename}]') as tqdm_instance:
+        def progress(hashed, total):
+            tqdm_instance.total = total
+            tqdm_instance.update(hashed - tqdm_instance.n)
+        piecehash.generate(t, workers=hash_workers, callback=progress, cache=piece_cache, manifest=release_manifest)
     ## Format releasedata to bring a suitable torrent name.
     # The reason we don't just use the directory name is because of an error in POSTING.
     # POSTS do not seem to POST hangul/jp characters alongside files.
     filename = f"{releasedata['artist']} - {releasedata['title']} [{releasedata['media']}-{releasedata['format']}].torrent"
 
-    try:
-        t.write(filename)
-        print("_" * 100)
-        print("Torrent creation:\n")
-        print(f"{filename} has been created.")
-    except:
-        print("_" * 100)
-        print("Torrent creation:\n")
-        os.remove(filename)
-        print(f"{filename} already exists, existing torrent will be replaced.")
-        t.write(filename)
-        print(f"{filename} has been created.")
+    torrentdata = t.dump()
 
-    return filename
+    print("_" * 100)
+    print("Torrent creation:\n")
+    if cfg['local_prefs'].get('save_torrent', True):
+        if os.path.exists(filename):
+            print(f"{filename} already exists, existing torrent will be replaced.")
+        with open(filename, 'wb') as f:
+            f.write(torrentdata)
+    print(f"{filename} has been created.")
+
+    return filename, torrentdata
 
 # Reads FLAC file and returns metadata.
+@profiler.traced('tags')
 def readflac(filename):
+    from mutagen.flac import FLAC
     read = FLAC(filename)
 
     # Create dict containing all meta fields we'll be using.
@@ -113,20 +222,29 @@ def readflac(filename):
 
     return tags
 
+# ID3 frames are converted to a list of strings so MP3 tags look like FLAC tags and can be stored in the tag index.
+def frametext(frame):
+    if frame == None:
+        return None
+
+    return [str(text) for text in frame.text]
+
 # Reads MP3 file and returns metadata.
+@profiler.traced('tags')
 def readmp3(filename):
+    from mutagen.mp3 import MP3
     read = MP3(filename)
 
     # Create dict containing all meta fields we'll be using.
     tags={
-        "ALBUM": read.get('TALB'), # Album Title
-        "ALBUMARTIST": read.get('TPE2'), # Album Artist
-        "ARTIST": read.get('TPE1'), # Track Artist
+        "ALBUM": frametext(read.get('TALB')), # Album Title
+        "ALBUMARTIST": frametext(read.get('TPE2')), # Album Artist
+        "ARTIST": frametext(read.get('TPE1')), # Track Artist
         "DATE": str(read.get('TDRC')), # Date YYYYMMDD (Will need to add a try/except for other possible identifiers)
         "GENRE": read.get('TCON').text, # Genre
-        "TITLE": read.get('TIT2'), # Track Title
-        "COMMENT": read.get('COMM::eng'), # Track Comment
-        "GROUPING": read.get('TIT1'), # Grouping
+        "TITLE": frametext(read.get('TIT2')), # Track Title
+        "COMMENT": frametext(read.get('COMM::eng')), # Track Comment
+        "GROUPING": frametext(read.get('TIT1')), # Grouping
         "TRACKNUMBER": re.sub(r"\/.*", "", str(read.get('TRCK'))).zfill(2), # Tracknumber (Format #/Total) Re.sub removes /#
         "DISCNUMBER": re.sub(r"\/.*", "", str(read.get('TPOS')))} # Discnumber (Format #/Total) Re.sub removes /#
 
@@ -139,6 +257,37 @@ def readmp3(filename):
 
     return tags
 
+## Reads the tags of every FLAC/MP3 file of a release manifest and returns them keyed by relative path.
+# Files are read on a thread pool, files that haven't changed since the last run are taken from the tag index.
+def readtags(release_manifest):
+    filetags = {}
+    unread = []
+    for file in release_manifest.bykind('flac', 'mp3'):
+        if tag_index:
+            filetags[file.relpath] = tag_index.get(file.path, file.size, file.mtime)
+        if filetags.get(file.relpath) == None:
+            unread.append(file)
+
+    def read(file):
+        if file.kind == 'flac':
+            return readflac(file.path)
+        return readmp3(file.path)
+
+    with ThreadPoolExecutor(max_workers=cfg['local_prefs'].get('tag_workers', 8)) as executor:
+        for file, tags in zip(unread, executor.map(read, unread)):
+            filetags[file.relpath] = tags
+
+    if tag_index and unread:
+        tag_index.put([(file.path, file.size, file.mtime, filetags[file.relpath]) for file in unread])
+
+    return filetags
+
+# Disc number taken from a CD1/Disc 2 folder, for multi-disc releases whose files have no disc number tag.
+def folderdisc(relpath):
+    match = re.search(r'(?:cd|disc|disk)\s*0*(\d+)$', os.path.dirname(relpath), re.IGNORECASE)
+
+    return match.group(1) if match else None
+
 # Generates new log file based on directory contents
 def generatelog(track_titles, log_filename, log_directory):
     # Seperate each tracklist entry in the list with a newline
@@ -165,63 +314,41 @@ def generatelog(track_titles, log_filename, log_directory):
 
     return log_contents
 
-def readlog(log_name, log_directory):
-    with open(f"{log_directory}/{log_name}.log", "r+") as f:
-        log_contents = f.read()
-        f.close()
+## Reads the BugsPy log of a release, looked up by album id (the comment tag) and then by "Artist - Title".
+# Returns None if there is no matching log.
+def readlog(log_names, log_directory):
+    if log_index:
+        log_path = log_index.find(log_directory, log_names)
+    else:
+        log_path = next((f"{log_directory}/{name}.log" for name in log_names if name and os.path.isfile(f"{log_directory}/{name}.log")), None)
+    if log_path == None:
+        return None
+
+    try:
+        with open(log_path, "r", encoding='utf-8', errors='replace') as f:
+            log_contents = f.read()
+    except FileNotFoundError:
+        # Removed since the log directory was indexed.
+        return None
 
     return log_contents
 
+# Hangul dictionary shared by every translation, loaded on first use and written back in batches.
+hangul_dict = dictstore.DictionaryStore("json_data/dictionary.json")
+# Write back any entries that haven't reached a batch yet.
+atexit.register(hangul_dict.flush)
+
 def add_to_hangul_dict(hangul , english , category):
     hangul = str(hangul)
     english = str(english)
 
-    categories = ['version','general','artist','genres', 'label', 'distr']
-    file = f"json_data/dictionary.json"
-    json_file = open(file, 'r', encoding='utf-8', errors='ignore')
-    dictionary = json.load(json_file)
-    json_file.close()
-
-    new = dict()
-    for cats in dictionary:
-        #== Create the categories in the new temp file
-        new[cats] = dict()
-
-        for key,value in dictionary[cats].items():
-            #== List all the old items into the new dict
-            new[cats][key] = value
-
-    if hangul in new[category].keys():
-
-        if new[category].get(hangul) is None:
-
-            if english != 'None':
-                new[category][hangul] = english
-
-        else:
-            #== Only update if English word has been supplied ==#
-            if english != 'None':
-                new[category][hangul] = english
-    else:
-
-        if english == 'None':
-            new[category][hangul] = None
-        else:
-            new[category][hangul] = english
-
-    json_write = open(file, 'w+', encoding='utf-8')
-    json_write.write(json.dumps(new, indent=4, ensure_ascii=False))
-    json_write.close()
+    hangul_dict.add(hangul, english, category)
 
 def translate(string, category, result=None, output=None):
 
-    file = "json_data/dictionary.json"
-    with open(file, encoding='utf-8', errors='ignore') as f:
-        dictionary = json.load(f, strict=False)
-
     category = str(category)
     string = str(string)
-    search = dictionary[category]
+    search = hangul_dict.category(category)
     string = string.strip()
 
     if string == 'Various Artists':
@@ -277,33 +404,51 @@ def translate(string, category, result=None, output=None):
         #== No parentheses - HANGUL
         else:
 
+            #== Keys are looked up normalized (NFC, case and whitespace), so "iu " finds "IU" ==#
+            key = hangul_dict.find(string, category)
+
             #== If the input string is a full Hangul word - check dictionary and then add if necessary)
             if re.search("[^\u0000-\u007F]+", string):
 
-                if string in search.keys():
-                #== yes
-                    if search.get(string) is None:
-                        #== If the keyword does not have a translation, add it to the dictionary ==#
-                        output = [string,None]
-                    else:
-                        #== Translation already exists, output the result in a list ==#
-                        output = [string,search.get(string)]
+                if key != None:
+                    #== Translation may be None if the keyword does not have one yet ==#
+                    output = [key,search.get(key)]
                 else:
                     output = [string,None]
                     add_to_hangul_dict(string, None, category)
 
-            #== Full English name -- leave it
+            #== Full English name -- leave it, using the dictionary's spelling if it's a known key or translation
             else:
-                for key,value in search.items():
-                    if key == string:
-                        output = [value,string]
-                        break
+                if key != None:
+                    output = [search.get(key),key]
+                else:
+                    reverse = hangul_dict.findreverse(string, category)
+                    if reverse != None:
+                        output = [search[reverse],search[reverse]]
                     else:
                         output = [string,string]
 
     return output
 
-def gatherdata(directory):
+# Separators of composite artist credits such as "A, B & C (feat. D)".
+composite_separators = re.compile(r',|&|\s(?:feat\.?|ft\.|with|x)\s', re.IGNORECASE)
+
+## Translates every known name within a composite string in a single pass over it.
+# Returns None if Hangul is left once every match has been replaced.
+def translatecomposite(string, category):
+    string = unicodedata.normalize('NFC', str(string))
+    parts = []
+    end = 0
+    for start, stop, english in hangul_dict.findall(string, category):
+        parts.append(string[end:start])
+        parts.append(english)
+        end = stop
+    parts.append(string[end:])
+    translated = ''.join(parts)
+
+    return None if 'hangul' in detectscripts(translated) else translated
+
+def gatherdata(directory, release_manifest=None):
     # Lists for storing some
     list_album_artists = []
     list_track_artists = []
@@ -320,51 +465,57 @@ def gatherdata(directory):
     log_available = False
     flac_present = False
     mp3_present = False
-    # Read directory contents, grab metadata of .FLAC files.
-    for file in os.listdir(directory):
-        file_location = os.path.join(directory, file)
-        if file.endswith(".flac"):
+    # Read directory contents (including CD1/CD2 folders of multi-disc releases), grab metadata of .FLAC files.
+    if release_manifest == None:
+        release_manifest = manifest.scan(directory)
+    filetags = readtags(release_manifest)
+    for file in release_manifest.files:
+        if file.kind == 'flac':
             # Read FLAC file to grab meta
-            tags = readflac(file_location)
+            tags = filetags[file.relpath]
             flac_present = True
+            disc = tags['DISCNUMBER'][0] if tags['DISCNUMBER'] != None else folderdisc(file.relpath)
             # If Discnumber isn't present then we omit it from the tracklist entry
-            if tags['DISCNUMBER'] == None:
+            if disc == None:
                 tracklist_entry = f"[b]{tags['TRACKNUMBER']}[/b]. {tags['TITLE'][0]}"
             else:
-                tracklist_entry = f"[b]{tags['DISCNUMBER'][0]}-{tags['TRACKNUMBER']}[/b]. {tags['TITLE'][0]}"
+                tracklist_entry = f"[b]{disc}-{tags['TRACKNUMBER']}[/b]. {tags['TITLE'][0]}"
 
             tracklist_entries.append(tracklist_entry)
 
             if debug:
                 print ("_" * 100)
-                print(f"Tags for {file}:\n{tags}")
+                print(f"Tags for {file.relpath}:\n{tags}")
 
-        if file.endswith(".mp3"):
+        if file.kind == 'mp3':
             # Read MP3 file to grab meta
-            tags = readmp3(file_location)
+            tags = filetags[file.relpath]
             mp3_present = True
+            disc = tags['DISCNUMBER'] if tags['DISCNUMBER'] != "None" else folderdisc(file.relpath)
             # If Discnumber isn't present then we omit it from the tracklist entry
-            if tags['DISCNUMBER'] == "None":
+            if disc == None:
                 tracklist_entry = f"[b]{tags['TRACKNUMBER']}[/b]. {tags['TITLE'][0]}"
             else:
-                tracklist_entry = f"[b]{tags['DISCNUMBER']}-{tags['TRACKNUMBER']}[/b]. {tags['TITLE'][0]}"
+                tracklist_entry = f"[b]{disc}-{tags['TRACKNUMBER']}[/b]. {tags['TITLE'][0]}"
 
             tracklist_entries.append(tracklist_entry)
 
             if debug:
                 print ("_" * 100)
-                print(f"Tags for {file}:\n{tags}")
-
-        # If only one genre in list attempt to split as there's likely more.
-        if len(tags['GENRE']) == 1:
-            tags['GENRE'] = tags['GENRE'][0].split(";")
-        for aa in tags['ALBUMARTIST']:
-            list_album_artists.append(aa)
-        for a in tags['ARTIST']:
-            list_track_artists.append(a)
-        list_album.append(tags['ALBUM'][0])
-        for g in tags['GENRE']:
-            list_genre.append(g)
+                print(f"Tags for {file.relpath}:\n{tags}")
+
+        # Covers, logs and other files carry no tags.
+        if file.relpath in filetags:
+            # If only one genre in list attempt to split as there's likely more.
+            if len(tags['GENRE']) == 1:
+                tags['GENRE'] = tags['GENRE'][0].split(";")
+            for aa in tags['ALBUMARTIST']:
+                list_album_artists.append(aa)
+            for a in tags['ARTIST']:
+                list_track_artists.append(a)
+            list_album.append(tags['ALBUM'][0])
+            for g in tags['GENRE']:
+                list_genre.append(g)
 
 
         # Check files to make sure there's no multi-format.
@@ -378,7 +529,7 @@ def gatherdata(directory):
             print("Mutt detected, exiting.")
             sys.exit()
 
-        if file.endswith(".log"):
+        if file.kind == 'log':
             log_available = True
 
         if log_available == True:
@@ -386,11 +537,6 @@ def gatherdata(directory):
         else:
             media = 'WEB'
 
-    # Load Dict.json for translations
-    file = "json_data/dictionary.json"
-    with open(file, encoding='utf-8', errors='ignore') as f:
-        dictionary = json.load(f, strict=False)
-
     # Split additional genre's at comma and append to existing genre tags
     if additional_tags != None:
         split_tags = additional_tags.split(",")
@@ -408,8 +554,13 @@ def gatherdata(directory):
             translated_artist_name = 'V.A.'
             translated_album_artists.append("V.A.")
         else:
-            translated_artist_name = translate(string=tags['ALBUMARTIST'][0], category="artist")
-            translated_album_artists.append(translated_artist_name[1])
+            # Composite credits are translated name by name, anything left unknown is resolved with the title below.
+            translated_artist_name = None
+            if composite_separators.search(tags['ALBUMARTIST'][0]):
+                translated_artist_name = translatecomposite(tags['ALBUMARTIST'][0], "artist")
+            if translated_artist_name == None:
+                translated_artist_name = translate(string=tags['ALBUMARTIST'][0], category="artist")[1] or tags['ALBUMARTIST'][0]
+            translated_album_artists.append(translated_artist_name)
 
     ## Identify unique values using sets.
     unique_album_artists = ','.join(set(translated_album_artists))
@@ -425,8 +576,13 @@ def gatherdata(directory):
         log_filename = f"{unique_album_artists} - {tags['ALBUM'][0]}"
         album_description = generatelog(tracklist_entries, log_filename, log_directory)
     else:
-        log_filename = tags['COMMENT'][0]
-        album_description = readlog(log_filename, log_directory)
+        album_id = tags['COMMENT'][0] if tags.get('COMMENT') else None
+        log_names = [album_id] + [f"{artist} - {tags['ALBUM'][0]}" for artist in [unique_album_artists, tags['ALBUMARTIST'][0]]]
+        album_description = readlog(log_names, log_directory)
+        # Without a matching log the tracklist is generated from the tags instead of stopping the run.
+        if album_description == None:
+            print(f"No log found for {album_id or tags['ALBUM'][0]} in {log_directory}, generating the tracklist instead")
+            album_description = generatelog(tracklist_entries, f"{unique_album_artists} - {tags['ALBUM'][0]}", log_directory)
 
     ## If release description is enabled we apply comments to the bugs album url
     # Note that this is dependant on the album being sourced from bugs so should be changed per user.
@@ -444,24 +600,21 @@ def gatherdata(directory):
     # POST values can be found by inspecting JPS HTML
     releasedata['submit'] = 'true'
 
+    ## Questions the tags can't answer are resolved without a prompt where possible, see ReleaseResolver.
+    resolver = ReleaseResolver(directory)
+
     # List of accepted upload types
     accepted_types = ['Album', 'Single']
-    # If type errors then we ask for user input
     try:
         releasedata['type'] = translate(tags['GROUPING'][0], "release_types")[0]
     except TypeError:
-        releasedata['type'] = input("\n" + "_" * 100 + "\nGrouping is empty or has received an error, please enter manually (Album/Single)\n")
-
-    # If type is still not in accepted_types we ask for user input again and do not break loop until correct
-    if releasedata['type'] not in accepted_types:
-        while True:
-            releasedata['type'] = input("\n" + "_" * 100 + "\nGrouping tag did not return an album type, please enter manually (Album/Single)\n")
-
-            if releasedata['type'] not in accepted_types:
-                continue
-            else:
-                break
-
+        releasedata['type'] = None
+    if 'type' in resolver.overrides:
+        releasedata['type'] = resolver.overrides['type']
+    elif releasedata['type'] not in accepted_types:
+        releasedata['type'] = cfg.get('resolve_prefs', {}).get('default_type') or resolver.ask(
+            'type', tags['GROUPING'][0] if tags.get('GROUPING') else None,
+            "Grouping tag did not return an album type, please enter manually (Album/Single)", accepted_types)
 
     releasedata['title'] = tags['ALBUM'][0]
     releasedata['artist'] = unique_album_artists
@@ -477,6 +630,9 @@ def gatherdata(directory):
     releasedata['release_desc'] = release_description
     releasedata['tags'] = unique_genre
 
+    # Write the dictionary entries added for this release in one go.
+    hangul_dict.flush()
+
     # Enable freeleech if arg is passed
     if freeleech:
         releasedata['freeleech'] = "true"
@@ -488,51 +644,144 @@ def gatherdata(directory):
         print("_" * 100)
         print("Title/Artist Language:\n")
         print(f"{releasedata['title']} < English = {en}")
-    if en == False:
-        input_english_title = input("\n" + "_" * 100 + "\nKorean/Japanese Detected. Please enter the romaji/english title:\n")
-        # Create new key called titlejp and assign the old title to it
-        releasedata['titlejp'] = releasedata['title']
-        # Replace title with the user input.
-        releasedata['title'] = input_english_title
+    if en == False or 'title' in resolver.overrides:
+        english_title = resolver.romaji('title', 'titles', releasedata['title'])
+        if en == False:
+            # Create new key called titlejp and assign the old title to it
+            releasedata['titlejp'] = releasedata['title']
+        # Replace title with the resolved one.
+        releasedata['title'] = english_title
 
     en = detectlanguage(releasedata['artist'])
     if debug:
         print(f"{releasedata['artist']} < English = {en}")
-    if en == False:
-        input_english_artist = input("\n" + "_" * 100 + "\nKorean/Japanese Detected. Please enter the romaji/english artist name:\n")
-        # Create new key called titlejp and assign the old title to it
-        # Replace title with the user input.
-        releasedata['artist'] = input_english_artist
+    if en == False or 'artist' in resolver.overrides:
+        releasedata['artist'] = resolver.romaji('artist', 'artist', releasedata['artist'])
+
+    # Any other key of the override file replaces the field itself.
+    releasedata.update({key: value for key, value in resolver.overrides.items() if key not in ['type', 'title', 'artist']})
+    resolver.finish()
 
     return releasedata
 
-# Simple function to split a string up into characters
-def split(word):
-    return [char for char in word]
+## Answers the questions gatherdata can't settle from the tags: the release type and the romaji title/artist.
+# Answers come, in order, from the release's override file, romaji entered earlier (stored in dictionary.json)
+# and, for Hangul, Revised Romanization. Anything left is asked with input() under the prompt policy,
+# under the review policy (the default when stdin isn't a terminal) the release is added to the review queue
+# and stopped instead, so batches and the watch folder never wait on a prompt.
+class ReleaseResolver:
+    def __init__(self, directory):
+        self.resolve_prefs = cfg.get('resolve_prefs', {})
+        self.directory = directory
+        self.override_path = resolve.overridepath(self.resolve_prefs.get('override_directory', 'cache/overrides'), directory)
+        self.overrides = resolve.readoverrides(self.override_path)
+        self.prompt = unresolvedpolicy() == 'prompt'
+        # Questions sent to the review queue, keyed by field with the value found in the tags.
+        self.unresolved = {}
+
+    def ask(self, field, original, question, accepted=None):
+        if not self.prompt:
+            self.unresolved[field] = original
+            return original
+        while True:
+            answer = input("\n" + "_" * 100 + f"\n{question}\n")
+            if accepted == None or answer in accepted:
+                return answer
+
+    def romaji(self, field, category, string):
+        if field in self.overrides:
+            return self.overrides[field]
+        known = hangul_dict.category(category).get(string)
+        if known:
+            return known
+        if self.resolve_prefs.get('romanize_hangul', True) and detectscripts(string) <= {'latin', 'hangul'}:
+            return resolve.romanize(string)
+
+        answer = self.ask(field, string, f"Korean/Japanese Detected. Please enter the romaji/english {'artist name' if field == 'artist' else field}:")
+        if self.prompt:
+            # Remembered so the next release with the same title/artist resolves on its own.
+            hangul_dict.add(string, answer, category)
+            hangul_dict.flush()
+
+        return answer
+
+    def finish(self):
+        review_queue = self.resolve_prefs.get('review_queue', 'cache/review.json')
+        resolve.queueforreview(review_queue, self.directory, self.unresolved)
+        if self.unresolved:
+            print("_" * 100)
+            print(f"{self.directory} needs review, added to {review_queue}: {', '.join(self.unresolved)}")
+            print(f"Answer in {self.override_path}, e.g. {json.dumps({field: '...' for field in self.unresolved})}")
+            sys.exit()
+
+# prompt asks with input(), review adds the release to the review queue.
+# auto prompts only for a single release run from a terminal, batch and watch runs never wait on input().
+def unresolvedpolicy():
+    policy = cfg.get('resolve_prefs', {}).get('unresolved', 'auto')
+    if policy == 'auto':
+        return 'prompt' if not unattended and sys.stdin and sys.stdin.isatty() else 'review'
+
+    return policy
+
+## Unicode blocks of the scripts we don't want in the title/artist fields.
+# Characters are classified by codepoint, which takes microseconds compared to running langdetect.
+script_blocks = {
+    'hangul': [(0x1100, 0x11FF), (0x3130, 0x318F), (0xA960, 0xA97F), (0xAC00, 0xD7AF), (0xD7B0, 0xD7FF), (0xFFA0, 0xFFDC)],
+    'kana': [(0x3040, 0x309F), (0x30A0, 0x30FF), (0x31F0, 0x31FF), (0xFF66, 0xFF9F)],
+    'cjk': [(0x3400, 0x4DBF), (0x4E00, 0x9FFF), (0xF900, 0xFAFF), (0x20000, 0x2FA1F)]}
+# langdetect codes of the same languages, used when falling back on langdetect.
+cjk_languages = ['ko', 'ja', 'zh-cn', 'zh-tw']
+
+## Returns the set of scripts used by the letters of a string.
+# Latin letters return 'latin', letters of any other script we don't know return 'other'.
+# Digits, punctuation and symbols don't count towards any script.
+def detectscripts(string):
+    scripts = set()
+    for c in string:
+        if not unicodedata.category(c).startswith('L'):
+            continue
+        codepoint = ord(c)
+        if codepoint <= 0x024F or 0x1E00 <= codepoint <= 0x1EFF or 0xFF21 <= codepoint <= 0xFF5A:
+            scripts.add('latin')
+            continue
+        for script, blocks in script_blocks.items():
+            if any(start <= codepoint <= end for start, end in blocks):
+                scripts.add(script)
+                break
+        else:
+            scripts.add('other')
+
+    return scripts
+
+## Runs langdetect on the whole string, results are memoized as titles/artists repeat across a batch.
+# Seeding the DetectorFactory makes langdetect deterministic.
+@functools.lru_cache(maxsize=1024)
+def langdetectfallback(string):
+    from langdetect import detect, DetectorFactory
+    DetectorFactory.seed = 0
+    try:
+        return detect(string)
+    except:
+        return "error"
 
 def detectlanguage(string):
     ## Language Detect
     # This is a required check as we don't want to enter non-english/romaji characters into the title field.
-    characters = split(string)
-    language_list = []
-    for c in characters:
-        try:
-            language = detect(c)
-            language_list.append(language)
-        except:
-            langauge = "error"
-
-    if 'ko' in language_list:
+    scripts = detectscripts(string)
+    if scripts & set(script_blocks):
         en = False
+    # Only letters of a script we don't classify are handed to langdetect.
+    elif 'other' in scripts and cfg['local_prefs'].get('langdetect_fallback', True):
+        en = langdetectfallback(string) not in cjk_languages
     else:
         en = True
 
     return en
 
-def uploadtorrent(torrent, cover, releasedata):
+def uploadtorrent(torrentname, torrentdata, cover, releasedata):
 
     # POST url.
-    uploadurl = "https://jpopsuki.eu/upload.php"
+    uploadurl = f"{jps_url}/upload.php"
 
     # Dataset containing all of the information obtained from our FLAC files.
     data = releasedata
@@ -542,31 +791,36 @@ def uploadtorrent(torrent, cover, releasedata):
         print('Release Data:\n')
         print(releasedata)
 
-    try:
-        postDataFiles = {
-            'file_input': open(torrent, 'rb'),
-            'userfile': open(cover, 'rb')
-        }
-    except FileNotFoundError:
+    # Cover is the (filename, data) prepared by cover.prepare, releases without any cover are posted without one.
+    postDataFiles = {
+        'file_input': (torrentname, torrentdata)
+    }
+    if cover != None:
+        postDataFiles['userfile'] = cover
+    else:
         print("_" * 100)
-        print('File not found!\nPlease confirm file locations and names. Cover image or .torrent file could not be found')
-        sys.exit()
+        print(f"No {cfg['local_prefs']['cover_name']} or embedded art found, uploading without a cover")
 
     # If dryrun argument has not ben passed we will POST the results to JPopSuki.
     if dryrun != True:
         JPSres = j.retrieveContent(uploadurl, "post", data, postDataFiles)
+        ## A successful upload redirects to the torrent page, a failed one renders upload.php again.
+        # The cached announce URL may be the reason (e.g. a reset passkey) so it's refreshed on the next run.
+        if not JPSres.ok or urlparse(JPSres.url).path.endswith('upload.php'):
+            invalidateauthkey()
+            print("_" * 100)
+            print(f'Upload failed! JPS responded with {JPSres.status_code} on {JPSres.url}')
+            sys.exit()
         print('\nUpload POSTED')
 
     ## TODO Filter through JPSres.text and create error handling based on responses
     #print(JPSres.text)
 
 # Function for transferring the contents of the torrent as well as the torrent.
-def ftp_transfer(fileSource, fileDestination, directory, folder_name, watch_folder):
+def ftp_transfer(torrentname, torrentdata, fileDestination, directory, folder_name, watch_folder, release_manifest=None):
 
     # Create session
-    session = ftplib.FTP(cfg['ftp_prefs']['ftp_server'],cfg['ftp_prefs']['ftp_username'],cfg['ftp_prefs']['ftp_password'])
-    # Set session encoding to utf-8 so we can properly handle hangul/other special characters
-    session.encoding='utf-8'
+    session = ftptransfer.connect(cfg['ftp_prefs'])
 
     # Successful FTP Login Print
     print("_" * 100)
@@ -575,49 +829,287 @@ def ftp_transfer(fileSource, fileDestination, directory, folder_name, watch_fold
 
     if cfg['ftp_prefs']['add_to_downloads_folder']:
 
-        # Create folder based on the directory name of the folder within the torrent.
-        try:
-            session.mkd(f"{fileDestination}/{folder_name}")
-            print(f'Created directory {fileDestination}/{folder_name}')
-        except ftplib.error_perm:
-            pass
+        if release_manifest == None:
+            release_manifest = manifest.scan(directory)
+        # Create folder based on the directory name of the folder within the torrent, and its CD1/CD2 folders.
+        for remote_folder in [folder_name] + [f"{folder_name}/{subdirectory}" for subdirectory in release_manifest.subdirectories()]:
+            try:
+                session.mkd(f"{fileDestination}/{remote_folder}")
+                print(f'Created directory {fileDestination}/{remote_folder}')
+            except ftplib.error_perm:
+                pass
 
         # Notify user we are beginning the transfer.
         print(f"Beginning transfer...")
-        # Set current folder to the users preferred destination
-        session.cwd(f"{fileDestination}/{folder_name}")
-        # Transfer each file in the chosen directory
-        for file in os.listdir(directory):
-            with open(f"{directory}/{file}",'rb') as f:
-                filesize = os.path.getsize(f"{directory}/{file}")
-                ## Transfer file
-                # tqdm used for better user feedback.
-                with tqdm(unit = 'blocks', unit_scale = True, leave = False, miniters = 1, desc = f'Uploading [{file}]', total = filesize) as tqdm_instance:
-                    session.storbinary('STOR ' + file, f, 2048, callback = lambda sent: tqdm_instance.update(len(sent)))
-                print(f"{file} | Complete!")
-                f.close()
-
-    if cfg['ftp_prefs']['add_to_watch_folder']:
-        with open(fileSource,'rb') as t:
-            # Set current folder to watch directory
-            session.cwd(watch_folder)
-            ## Transfer file
-            # We avoid tqdm here due to the filesize of torrent files.
-            # Most connections will upload these within 1-3s, resulting in near useless progress bars.
-            session.storbinary(f"STOR {torrentfile}", t)
-            print(f"{torrentfile} | Sent to watch folder!")
-            t.close()
+        # Transfer each file in the chosen directory, files are spread over several connections.
+        # Files a previous, interrupted run already transferred are skipped.
+        done = journaledstages(directory)
+        files = [(file.path, file.relpath, file.size) for file in release_manifest.files if f"ftp:{file.relpath}" not in done]
+        ftptransfer.transferfiles(cfg['ftp_prefs'], f"{fileDestination}/{folder_name}", files, desc=f'Uploading [{folder_name}]', session=session,
+                                  completed=lambda name: journalstage(directory, f"ftp:{name}"))
+
+    if cfg['ftp_prefs']['add_to_watch_folder'] and 'ftp:watch' not in journaledstages(directory):
+        # Set current folder to watch directory
+        session.cwd(watch_folder)
+        ## Transfer file
+        # We avoid tqdm here due to the filesize of torrent files.
+        # Most connections will upload these within 1-3s, resulting in near useless progress bars.
+        with profiler.span(f"STOR {torrentname}", 'ftp'):
+            session.storbinary(f"STOR {torrentname}", io.BytesIO(torrentdata))
+        print(f"{torrentname} | Sent to watch folder!")
+        journalstage(directory, 'ftp:watch')
     # Quit session when complete.
     session.quit()
 
-def localfileorganization(torrent, directory, watch_folder, downloads_folder):
+def localfileorganization(torrentname, torrentdata, directory, watch_folder, downloads_folder, release_manifest=None):
 
-    # Move torrent directory to downloads_folder
+    ## Place the torrent data in downloads_folder for seeding.
+    # Files are reflinked, hardlinked or copied in the kernel, the original directory stays where it is.
     if cfg['local_prefs']['add_to_downloads_folder']:
-        os.rename(directory, f"{downloads_folder}/{directory}")
-    # Move torrent file to ftp_watch_folder
+        destination = f"{downloads_folder}/{os.path.basename(os.path.normpath(directory))}"
+        counts = placement.placetree(directory, destination, cfg['local_prefs'].get('placement_methods', placement.default_methods), release_manifest)
+        print(f"Placed in {destination} | " + ", ".join(f"{method}: {count}" for method, count in counts.items()))
+    # Write torrent file to local_watch_folder
     if cfg['local_prefs']['add_to_watch_folder']:
-        os.rename(torrent, f"{watch_folder}/{torrent}")
+        with open(f"{watch_folder}/{torrentname}", 'wb') as f:
+            f.write(torrentdata)
+
+# Runs a single release directory through every stage of the upload.
+# Each stage waits for a free slot so a batch never runs more workers per stage than configured.
+def processrelease(directory):
+    # Every stage works from this single scan of the release.
+    release_manifest = manifest.scan(directory)
+    done = resumejob(directory, release_manifest)
+
+    if 'gatherdata' in done:
+        releasedata = done['gatherdata']['releasedata']
+    else:
+        with stage('gatherdata'):
+            # Gather data of FLAC file
+            releasedata = gatherdata(directory, release_manifest)
+
+        # Rejected dupes never reach the hashing.
+        checkdupe(releasedata)
+        journalstage(directory, 'gatherdata', {'releasedata': releasedata, 'files': release_manifest.fingerprint()})
+
+    # Folder_name equals the last folder in the path, this is used to rename .torrent files to something relevant.
+    folder_name = os.path.basename(os.path.normpath(directory))
+
+    if 'createtorrent' in done:
+        torrentname, torrentdata = done['createtorrent']['torrentname'], base64.b64decode(done['createtorrent']['torrentdata'])
+        # A rejected POST refreshes the announce URL (e.g. a reset passkey), the info hash is unaffected by it.
+        if done['createtorrent'].get('announce') != authkey:
+            torrentdata = releaseplan.reannounce(torrentdata, authkey)
+            journalstage(directory, 'createtorrent', {'torrentname': torrentname, 'torrentdata': base64.b64encode(torrentdata).decode('ascii'), 'announce': authkey})
+    else:
+        with stage('createtorrent'):
+            # Create torrent file.
+            torrentname, torrentdata = createtorrent(authkey, directory, folder_name, releasedata, release_manifest)
+        journalstage(directory, 'createtorrent', {'torrentname': torrentname, 'torrentdata': base64.b64encode(torrentdata).decode('ascii'), 'announce': authkey})
+
+    deliverrelease(directory, releasedata, torrentname, torrentdata, release_manifest)
+
+    # A dryrun saves everything deliverrelease needs as the plan for --apply.
+    if dryrun:
+        entry = releaseplan.makeentry(directory, releasedata, torrentname, torrentdata, authkey, release_manifest.fingerprint())
+        with plan_lock:
+            planned_releases.append(entry)
+
+    return torrentname
+
+## Uploads a release and places its files, the stages shared by processrelease and --apply.
+def deliverrelease(directory, releasedata, torrentname, torrentdata, release_manifest=None):
+    # Folder_name equals the last folder in the path, this is used to rename .torrent files to something relevant.
+    folder_name = os.path.basename(os.path.normpath(directory))
+    if release_manifest == None:
+        release_manifest = manifest.scan(directory)
+
+    done = journaledstages(directory)
+
+    # A POST accepted before an interrupted run is never repeated.
+    if 'uploadtorrent' not in done:
+        infohash = uploadindex.infohash(torrentdata) if upload_index else None
+        checkdupe(releasedata, infohash)
+
+        # The cover is shrunk outside the upload slot, so other releases can POST meanwhile.
+        release_cover = cover.prepare(directory, cfg['local_prefs']['cover_name'], release_manifest, cfg.get('cover_prefs', {}), cover_cache)
+
+        with stage('uploadtorrent'):
+            # Upload torrent to JPopSuki
+            uploadtorrent(torrentname, torrentdata, release_cover, releasedata)
+            if upload_index and not dryrun:
+                upload_index.put(releasedata, infohash, directory)
+        journalstage(directory, 'uploadtorrent')
+
+    # Setting variable for watch/download folders
+    ftp_watch_folder = cfg['ftp_prefs']['ftp_watch_folder']
+    ftp_downloads_folder = cfg['ftp_prefs']['ftp_downloads_folder']
+    local_watch_folder = cfg['local_prefs']['local_watch_folder']
+    local_downloads_folder = cfg['local_prefs']['local_downloads_folder']
+
+    if cfg['ftp_prefs']['enable_ftp'] and 'ftp_transfer' not in done:
+        with stage('ftp_transfer'):
+            ftp_transfer(torrentname=torrentname, torrentdata=torrentdata, fileDestination=ftp_downloads_folder, directory=directory, folder_name=folder_name, watch_folder=ftp_watch_folder, release_manifest=release_manifest)
+        journalstage(directory, 'ftp_transfer')
+
+    if (cfg['local_prefs']['add_to_watch_folder'] or cfg['local_prefs']['add_to_downloads_folder']) and 'localfileorganization' not in done:
+        with stage('localfileorganization'):
+            localfileorganization(torrentname=torrentname, torrentdata=torrentdata, directory=directory, watch_folder=local_watch_folder, downloads_folder=local_downloads_folder, release_manifest=release_manifest)
+        journalstage(directory, 'localfileorganization')
+
+    # Every stage is done, nothing is left to resume.
+    if job_journal and not dryrun:
+        job_journal.clear(directory)
+
+## Job journal helpers, dryruns aren't journaled since they don't POST.
+# Returns the data recorded by each completed stage of a release keyed by stage name.
+def journaledstages(directory):
+    if job_journal and not dryrun:
+        return job_journal.stages(directory)
+
+    return {}
+
+def journalstage(directory, stage_name, data=None):
+    if job_journal and not dryrun:
+        job_journal.record(directory, stage_name, data)
+
+## Returns the stages of a release completed by an interrupted run.
+# Tags and the torrent are only reused while the files are unchanged, once the POST was accepted the rest is always resumed.
+def resumejob(directory, release_manifest):
+    if restart and job_journal:
+        job_journal.clear(directory)
+    done = journaledstages(directory)
+    if not done:
+        return done
+
+    if 'uploadtorrent' not in done and 'gatherdata' in done and release_manifest.fingerprint() != done['gatherdata']['files']:
+        print(f"{directory} changed since the interrupted run, starting over")
+        job_journal.clear(directory)
+        return {}
+
+    print("_" * 100)
+    transferred = sum(stage_name.startswith('ftp:') for stage_name in done)
+    print(f"Resuming {directory} after {', '.join(stage_name for stage_name in done if not stage_name.startswith('ftp:'))}"
+          + (f" and {transferred} FTP transfer(s)" if transferred else ""))
+
+    return done
+
+## Uploads a release from a plan entry once its files are confirmed unchanged since the dryrun.
+def applyrelease(entry):
+    changed = releaseplan.changedfiles(entry)
+    if changed:
+        print("_" * 100)
+        print(f"{entry['directory']} changed since the plan was made, run the dryrun again:\n" + "\n".join(changed))
+        sys.exit()
+
+    torrentdata = entry['torrentdata']
+    # The passkey may have been reset since the dryrun, the info hash is unaffected by the announce URL.
+    if entry['announce'] != authkey:
+        torrentdata = releaseplan.reannounce(torrentdata, authkey)
+
+    deliverrelease(entry['directory'], entry['releasedata'], entry['torrentname'], torrentdata)
+
+    return entry['torrentname']
+
+# Plan entries of the releases processed during a dryrun.
+planned_releases = []
+plan_lock = threading.Lock()
+
+## Worker slots for each stage, shared by every release in a batch run.
+# Stages without an entry run without a limit.
+stage_slots = {}
+
+# Set for batch and watch runs, see unresolvedpolicy.
+unattended = False
+
+# Waits for a free slot of the stage, the time spent in the stage is recorded with --profile.
+@contextlib.contextmanager
+def stage(name):
+    with stage_slots.get(name, contextlib.nullcontext()):
+        with profiler.span(name, 'stage'):
+            yield
+
+# Creates the bounded worker slots for each stage from batch_prefs.
+def setstageslots(batch_prefs):
+    global unattended
+    unattended = True
+    # gatherdata may ask for input, so it runs one release at a time unless unresolved releases go to the review queue.
+    stage_slots['gatherdata'] = threading.BoundedSemaphore(1 if unresolvedpolicy() == 'prompt' else batch_prefs.get('gather_workers', 4))
+    stage_slots['createtorrent'] = threading.BoundedSemaphore(batch_prefs.get('torrent_workers', 2))
+    stage_slots['uploadtorrent'] = threading.BoundedSemaphore(batch_prefs.get('upload_workers', 1))
+    stage_slots['ftp_transfer'] = threading.BoundedSemaphore(batch_prefs.get('ftp_workers', 2))
+    stage_slots['localfileorganization'] = threading.BoundedSemaphore(1)
+
+# Expands the directories passed with -dir into the list of release directories to upload.
+def findreleases(directories, batch):
+    releases = []
+    for d in directories:
+        if batch:
+            # Every subdirectory of a parent folder is treated as its own release.
+            for entry in sorted(os.listdir(d)):
+                if os.path.isdir(os.path.join(d, entry)):
+                    releases.append(os.path.join(d, entry))
+        else:
+            releases.append(d)
+
+    return releases
+
+# Uploads several releases at once, the stages of different releases overlap on the stage slots.
+# process is called with each release, --apply passes applyrelease and plan entries.
+def batchupload(releases, jobs, process=processrelease, name=lambda release: release):
+    results = {}
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = {executor.submit(process, release): name(release) for release in releases}
+        for future in as_completed(futures):
+            release = futures[future]
+            # A failing release (including a sys.exit() from a stage) must not stop the rest of the batch.
+            try:
+                future.result()
+                results[release] = "Complete"
+            except (Exception, SystemExit) as e:
+                results[release] = f"Failed: {str(e) or type(e).__name__}"
+
+    print("_" * 100)
+    print("Batch Summary:\n")
+    for release in map(name, releases):
+        print(f"{results[release]} | {release}")
+
+    return results
+
+## Keeps running and uploads every release that lands in the watched folder.
+# Releases go through the same stage slots as a batch, the login session is kept warm in between.
+def watchupload(folder):
+    global authkey
+    watch_prefs = cfg.get('watch_prefs', {})
+    batch_prefs = cfg.get('batch_prefs', {})
+    setstageslots(batch_prefs)
+    watcher = watchfolder.ReleaseWatcher(folder, cfg['local_prefs']['cover_name'],
+                                         settle_seconds=watch_prefs.get('settle_seconds', 30),
+                                         require_log=watch_prefs.get('require_log', False),
+                                         poll_seconds=watch_prefs.get('poll_seconds', 10),
+                                         state_file=watch_prefs.get('state_file', 'cache/watched.json'),
+                                         override_directory=cfg.get('resolve_prefs', {}).get('override_directory', 'cache/overrides'),
+                                         # Releases without a cover file are uploaded with their embedded art.
+                                         require_cover=not cfg.get('cover_prefs', {}).get('extract_embedded', True))
+
+    def upload(release):
+        try:
+            processrelease(release)
+            print(f"Complete | {release}")
+            if dryrun:
+                with plan_lock:
+                    releaseplan.save(args.plan, planned_releases)
+        except (Exception, SystemExit) as e:
+            print(f"Failed: {str(e) or type(e).__name__} | {release}")
+
+    print(f"Watching {folder} for new releases{' (polling)' if watcher.polling else ''}...")
+    with ThreadPoolExecutor(max_workers=batch_prefs.get('jobs', 4)) as executor:
+        for release in watcher.releases(idle=j.keepAlive):
+            print("_" * 100)
+            print(f"New release: {release}")
+            # Cached announce URLs are cheap to check, this refreshes it once the TTL runs out.
+            authkey = getauthkey()
+            executor.submit(upload, release)
 
 if __name__ == "__main__":
 
@@ -627,7 +1119,13 @@ if __name__ == "__main__":
     # TODO consider calling args[] directly, we will then not need this line
     dryrun = freeleech = tags = directory = debug = None
 
-    directory = args.directory
+    hash_workers = args.hash_workers
+
+    if args.profile or args.profile_stage:
+        profiler.enable(args.profile_stage)
+        atexit.register(profiler.finish, args.profile)
+
+    directories = args.directory
     additional_tags = args.tags
 
     if args.dryrun:
@@ -642,38 +1140,78 @@ if __name__ == "__main__":
     # Load login credentials from JSON and use them to create a login session.
     with open(f'json_data/config.json') as f:
         cfg = json.load(f)
+
+    allow_dupes = args.allow_dupes
+    restart = args.restart
+
+    cache_prefs = cfg.get('cache_prefs', {})
+    # Releases uploaded from this machine, used to reject dupes before hashing.
+    upload_index = None
+    if cache_prefs.get('enable_upload_index', True):
+        upload_index = uploadindex.UploadIndex(cache_prefs.get('upload_index_path', 'cache/uploads.db'))
+    # .log files of the log directory, listed again only once the directory changes.
+    log_index = None
+    if cache_prefs.get('enable_log_index', True):
+        log_index = logindex.LogIndex(cache_prefs.get('log_index_path', 'cache/logs.json'),
+                                      refresh_seconds=cache_prefs.get('log_index_refresh_seconds', 60))
+    # Stages completed by each release, lets an interrupted run continue where it stopped.
+    job_journal = None
+    if cache_prefs.get('enable_journal', True):
+        job_journal = journal.JobJournal(cache_prefs.get('journal_path', 'cache/journal.db'))
+    # Tags of previous runs, only files that changed since are opened again.
+    tag_index = None
+    if cache_prefs.get('enable_tag_index', True):
+        tag_index = tagindex.TagIndex(cache_prefs.get('tag_index_path', 'cache/tags.db'))
+    # Downscaled covers of previous runs, keyed by the hash of the original.
+    cover_cache = None
+    if cache_prefs.get('enable_cover_cache', True):
+        cover_cache = cover.CoverCache(cache_prefs.get('cover_cache_directory', 'cache/covers'),
+                                       max_size_mb=cache_prefs.get('cover_cache_max_size_mb', 64))
+    # Piece hashes of previous runs, lets a re-run over an unchanged release skip hashing.
+    piece_cache = None
+    if cache_prefs.get('enable_piece_cache', True) and not args.no_hash_cache:
+        piece_cache = piecehash.PieceCache(cache_prefs.get('piece_cache_directory', 'cache/pieces'),
+                                           max_age_days=cache_prefs.get('piece_cache_max_age_days', 30),
+                                           max_size_mb=cache_prefs.get('piece_cache_max_size_mb', 256))
+
     loginData = {'username': cfg['credentials']['username'], 'password': cfg['credentials']['password']}
-    loginUrl = "https://jpopsuki.eu/login.php"
-    loginTestUrl = "https://jpopsuki.eu"
+    loginUrl = f"{jps_url}/login.php"
+    loginTestUrl = jps_url
     successStr = "Latest 5 Torrents"
 
     # j is an object which can be used to make requests with respect to the loginsession
-    j = jpspy.MyLoginSession(loginUrl, loginData, loginTestUrl, successStr, debug=args.debug)
+    # The same session and authkey are shared by every release in a batch.
+    # Every request to JPS, from any thread of a batch, waits for the scheduler to stay polite to the tracker.
+    tracker_prefs = cfg.get('tracker_prefs', {})
+    scheduler = jpspy.RequestScheduler(tracker_prefs.get('requests_per_minute', 30), tracker_prefs.get('burst', 5))
+    j = jpspy.MyLoginSession(loginUrl, loginData, loginTestUrl, successStr, debug=args.debug,
+                             trustWindowSeconds=cache_prefs.get('session_trust_seconds', 5 * 60),
+                             scheduler=scheduler, sessionDirectory='cache')
     # Acquire authkey
     authkey = getauthkey()
-    # Gather data of FLAC file
-    releasedata = gatherdata(directory)
-
-    # Folder_name equals the last folder in the path, this is used to rename .torrent files to something relevant.
-    folder_name = os.path.basename(os.path.normpath(directory))
-    # Identifying cover.jpg path
-    cover_path = directory + "/" + cfg['local_prefs']['cover_name']
 
-    # Create torrent file.
-    torrentfile = createtorrent(authkey, directory, folder_name, releasedata)
-
-    # Upload torrent to JPopSuki
-    uploadtorrent(torrentfile, cover_path, releasedata)
-
-    # Setting variable for watch/download folders
-    ftp_watch_folder = cfg['ftp_prefs']['ftp_watch_folder']
-    ftp_downloads_folder = cfg['ftp_prefs']['ftp_downloads_folder']
-    local_watch_folder = cfg['local_prefs']['local_watch_folder']
-    local_downloads_folder = cfg['local_prefs']['local_downloads_folder']
+    if args.watch:
+        watchupload(args.watch)
+        sys.exit()
 
+    batch_prefs = cfg.get('batch_prefs', {})
+    if args.apply:
+        entries = releaseplan.load(args.apply)
+        if len(entries) == 1:
+            applyrelease(entries[0])
+        else:
+            setstageslots(batch_prefs)
+            batchupload(entries, args.jobs or batch_prefs.get('jobs', 4), process=applyrelease, name=lambda entry: entry['directory'])
+        sys.exit()
 
-    if cfg['ftp_prefs']['enable_ftp']:
-        ftp_transfer(fileSource=torrentfile, fileDestination=ftp_downloads_folder, directory=directory, folder_name=folder_name, watch_folder=ftp_watch_folder)
+    releases = findreleases(directories, args.batch)
+    if len(releases) == 1:
+        processrelease(releases[0])
+    else:
+        setstageslots(batch_prefs)
+        batchupload(releases, args.jobs or batch_prefs.get('jobs', 4))
 
-    if cfg['local_prefs']['add_to_watch_folder'] or cfg['local_prefs']['add_to_downloads_folder']:
-        localfileorganization(torrent=torrentfile, directory=directory, watch_folder=local_watch_folder, downloads_folder=local_downloads_folder)
+    if dryrun and planned_releases:
+        releaseplan.save(args.plan, planned_releases)
+        print("_" * 100)
+        print(f"Plan of {len(planned_releases)} release(s) written to {args.plan}, upload it with --apply {args.plan}")
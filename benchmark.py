@@ -0,0 +1,338 @@
+## End-to-end benchmark of the upload stages.
+# Generates synthetic releases, starts local stand-ins for jpopsuki.eu and an FTP server,
+# then times startup, gatherdata, translate, detectlanguage, createtorrent, uploadtorrent and ftp_transfer.
+# Results are written as JSON so runs can be compared to catch performance regressions.
+
+# Standard library packages
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import struct
+import logging
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+import statistics
+import http.server
+
+# Third-party packages
+from mutagen.flac import FLAC
+from mutagen.id3 import ID3, TALB, TPE1, TPE2, TDRC, TCON, TIT2, COMM, TIT1, TRCK, TPOS
+
+# JPS-AU files
+import autoupload
+import jpspy
+import dictstore
+import piecehash
+import tagindex
+import manifest
+import cover
+
+def getargs():
+    parser = argparse.ArgumentParser(description="Benchmark every upload stage against local stand-ins")
+    parser.add_argument("--tracks", help="Number of tracks per release", type=int, default=12)
+    parser.add_argument("--size", help="Size of each track in MB", type=float, default=20)
+    parser.add_argument("--format", help="Format of the synthetic release", choices=['flac', 'mp3'], default='flac')
+    parser.add_argument("--discs", help="Number of discs, releases with more than one disc get CD1..CDn folders", type=int, default=1)
+    parser.add_argument("--runs", help="Number of runs per stage", type=int, default=3)
+    parser.add_argument("--hash-workers", help="Number of processes used to hash torrent pieces", type=int)
+    parser.add_argument("--seed", help="Seed used for the synthetic tags", type=int, default=0)
+    parser.add_argument("-o", "--output", help="Write the results as JSON to this file", default="bench_output.json")
+
+    return parser.parse_args()
+
+## Synthetic releases
+# Random Hangul syllables are built from the Unicode Hangul block so tags look like real Bugs releases.
+def hangul(rng, length):
+    return ''.join(chr(0xAC00 + rng.randrange(11172)) for _ in range(length))
+
+def hangulwords(rng, words):
+    return ' '.join(hangul(rng, rng.randint(1, 4)) for _ in range(words))
+
+# Minimal FLAC stream (44.1kHz, 16 bit stereo STREAMINFO) that mutagen can tag, followed by random payload.
+def writeflac(path, size, tags):
+    streaminfo = struct.pack('>HH', 4096, 4096) + b'\0' * 6
+    streaminfo += ((44100 << 44) | (1 << 41) | (15 << 36)).to_bytes(8, 'big') + b'\0' * 16
+    with open(path, 'wb') as f:
+        f.write(b'fLaC' + bytes([0x80]) + len(streaminfo).to_bytes(3, 'big') + streaminfo)
+        f.write(os.urandom(size))
+    audio = FLAC(path)
+    for k, v in tags.items():
+        audio[k] = v
+    audio.save()
+
+# MPEG-1 Layer III frames (128kbps, 44.1kHz) that mutagen recognises as MP3, followed by random payload.
+def writemp3(path, size, tags):
+    with open(path, 'wb') as f:
+        f.write((b'\xff\xfb\x90\x64' + b'\0' * 413) * 20)
+        f.write(os.urandom(size))
+    id3 = ID3()
+    id3.add(TALB(encoding=3, text=tags['album']))
+    id3.add(TPE1(encoding=3, text=tags['artist']))
+    id3.add(TPE2(encoding=3, text=tags['albumartist']))
+    id3.add(TDRC(encoding=3, text=tags['date'][:4]))
+    id3.add(TCON(encoding=3, text=tags['genre']))
+    id3.add(TIT2(encoding=3, text=tags['title']))
+    id3.add(COMM(encoding=3, lang='eng', desc='', text=tags['comment']))
+    id3.add(TIT1(encoding=3, text=tags['grouping']))
+    id3.add(TRCK(encoding=3, text=f"{tags['tracknumber']}/{tags['tracktotal']}"))
+    if 'discnumber' in tags:
+        id3.add(TPOS(encoding=3, text=tags['discnumber']))
+    id3.save(path)
+
+# 3000px cover like the hi-res covers of Bugs if Pillow is installed, otherwise random bytes wrapped in JPEG markers.
+def writecover(path):
+    try:
+        from PIL import Image
+    except ImportError:
+        with open(path, 'wb') as f:
+            f.write(b'\xff\xd8\xff\xe0' + os.urandom(500000) + b'\xff\xd9')
+        return
+    Image.effect_noise((3000, 3000), 32).convert('RGB').save(path, 'JPEG', quality=95)
+
+## Creates a release directory of tracks with realistic Hangul tags, a cover and returns its path.
+# Artists and genres are taken from dictionary.json so translate() finds some of them, like a real run.
+def makerelease(parent, rng, dictionary, tracks, size, format, discs=1):
+    artist = rng.choice(list(dictionary['artist']) or [hangul(rng, 3)])
+    album = hangulwords(rng, rng.randint(1, 3))
+    genres = ';'.join(rng.sample([g for g in dictionary['genres'] if autoupload.detectscripts(g) & {'hangul'}], 2))
+    album_id = str(rng.randrange(100000, 9999999))
+    directory = os.path.join(parent, f"{artist} - {album} [2020.01.02] [EP] [WEB-{format.upper()}]")
+    os.makedirs(directory)
+
+    for disc in range(1, discs + 1):
+        disc_directory = os.path.join(directory, f"CD{disc}") if discs > 1 else directory
+        os.makedirs(disc_directory, exist_ok=True)
+        for n in range(1, tracks + 1):
+            tags = {'album': album, 'albumartist': artist, 'artist': artist, 'date': '2020.01.02', 'genre': genres,
+                    'title': hangulwords(rng, rng.randint(1, 4)), 'comment': album_id, 'tracknumber': str(n),
+                    'tracktotal': str(tracks), 'grouping': 'EP'}
+            if discs > 1:
+                tags['discnumber'] = str(disc)
+            path = os.path.join(disc_directory, f"{n:02d}.{format}")
+            if format == 'flac':
+                writeflac(path, size, tags)
+            else:
+                writemp3(path, size, tags)
+
+    writecover(os.path.join(directory, 'cover.jpg'))
+
+    return directory
+
+## Local stand-in for login.php/upload.php of jpopsuki.eu.
+# Logins set a session cookie, upload.php serves an announce URL and answers POSTs with a redirect to torrents.php.
+class TrackerHandler(http.server.BaseHTTPRequestHandler):
+    upload_page = b'''<html><body><div id="wrapper"><div id="content"><div class="thin"><form>
+<input type="text" value="http://127.0.0.1:2710/0123456789abcdef0123456789abcdef/announce" size="71" readonly="readonly" />
+</form></div></div></div></body></html>'''
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, body, status=200, headers={}):
+        self.send_response(status)
+        for k, v in headers.items():
+            self.send_header(k, v)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.startswith('/upload.php'):
+            self.reply(self.upload_page)
+        else:
+            self.reply(b'<html>Latest 5 Torrents</html>')
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.path.startswith('/login.php'):
+            self.reply(b'', 302, {'Location': '/', 'Set-Cookie': 'session=benchmark; Path=/'})
+        else:
+            self.reply(b'', 302, {'Location': '/torrents.php?id=1'})
+
+def starttracker():
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), TrackerHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+# Local FTP server, pyftpdlib is only needed for the benchmark so ftp_transfer is skipped without it.
+def startftp(root):
+    try:
+        from pyftpdlib.authorizers import DummyAuthorizer
+        from pyftpdlib.handlers import FTPHandler
+        from pyftpdlib.servers import ThreadedFTPServer
+    except ImportError:
+        return None, None
+    # Keep pyftpdlib from logging every command.
+    logger = logging.getLogger('pyftpdlib')
+    logger.setLevel(logging.WARNING)
+    logger.addHandler(logging.NullHandler())
+    logger.propagate = False
+    authorizer = DummyAuthorizer()
+    authorizer.add_user('benchmark', 'benchmark', root, perm='elradfmwMT')
+    handler = type('BenchmarkFTPHandler', (FTPHandler,), {'authorizer': authorizer})
+    server = ThreadedFTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server, server.address[1]
+
+## Timing helpers
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+
+    return time.perf_counter() - start, result
+
+def summary(times, **extra):
+    return dict({'runs': times, 'min': min(times), 'mean': statistics.mean(times), 'max': max(times)}, **extra)
+
+# Points the module globals autoupload expects from __main__ at the benchmark environment.
+def configure(work, base_url, ftp_port, hash_workers):
+    cfg = json.load(open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'json_data', 'config.json.example')))
+    cfg['local_prefs'].update({'log_directory': os.path.join(work, 'logs'), 'generate_tracklist': True,
+                               'save_tracklist': False, 'enable_release_description': True,
+                               'add_to_watch_folder': False, 'add_to_downloads_folder': False})
+    cfg['ftp_prefs'].update({'enable_ftp': ftp_port != None, 'ftp_server': '127.0.0.1', 'ftp_port': ftp_port,
+                             'ftp_username': 'benchmark', 'ftp_password': 'benchmark',
+                             'ftp_watch_folder': '/watch', 'ftp_downloads_folder': '/downloads'})
+    os.makedirs(cfg['local_prefs']['log_directory'], exist_ok=True)
+
+    autoupload.cfg = cfg
+    autoupload.debug = autoupload.freeleech = autoupload.additional_tags = None
+    autoupload.dryrun = False
+    autoupload.hash_workers = hash_workers
+    autoupload.jps_url = base_url
+    autoupload.tag_index = None
+    autoupload.upload_index = None
+    autoupload.allow_dupes = False
+    autoupload.job_journal = None
+    autoupload.log_index = None
+    autoupload.restart = False
+    autoupload.piece_cache = None
+    autoupload.cover_cache = None
+    # Work on a copy of the dictionary so new Hangul entries don't end up in json_data/dictionary.json.
+    shutil.copy(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'json_data', 'dictionary.json'), os.path.join(work, 'dictionary.json'))
+    autoupload.hangul_dict = dictstore.DictionaryStore(os.path.join(work, 'dictionary.json'))
+    # Any prompt left after resolution is answered automatically instead of going to the review queue.
+    cfg['resolve_prefs'] = {'unresolved': 'prompt', 'review_queue': os.path.join(work, 'review.json')}
+    autoupload.input = lambda prompt='': 'Album'
+
+    return cfg
+
+def run(args):
+    rng = random.Random(args.seed)
+    work = tempfile.mkdtemp(prefix='jpsau-bench-')
+    os.chdir(work)
+    tracker, base_url = starttracker()
+    ftp_root = os.path.join(work, 'ftp')
+    for folder in ['downloads', 'watch']:
+        os.makedirs(os.path.join(ftp_root, folder))
+    ftp, ftp_port = startftp(ftp_root)
+    cfg = configure(work, base_url, ftp_port, args.hash_workers)
+
+    dictionary = json.load(open(os.path.join(work, 'dictionary.json'), encoding='utf-8'))
+    release = makerelease(os.path.join(work, 'releases'), rng, dictionary, args.tracks, int(args.size * 1048576), args.format, args.discs)
+    release_size = sum(os.path.getsize(os.path.join(root, f)) for root, dirs, files in os.walk(release) for f in files)
+    folder_name = os.path.basename(release)
+    results = {}
+
+    # Startup, a fresh interpreter printing --help measures the cost of the imports alone.
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'autoupload.py')
+    results['startup_help'] = summary([timed(subprocess.run, [sys.executable, script, '--help'], stdout=subprocess.DEVNULL, check=True)[0] for i in range(args.runs)])
+
+    # Login and authkey, both against the local stand-in.
+    elapsed, autoupload.j = timed(jpspy.MyLoginSession, f"{base_url}/login.php", {'username': 'benchmark', 'password': 'benchmark'},
+                                  base_url, "Latest 5 Torrents", forceLogin=True)
+    results['login'] = summary([elapsed])
+    times = []
+    for i in range(args.runs):
+        autoupload.invalidateauthkey()
+        elapsed, autoupload.authkey = timed(autoupload.getauthkey)
+        times.append(elapsed)
+    results['getauthkey'] = summary(times)
+    results['getauthkey_cached'] = summary([timed(autoupload.getauthkey)[0] for i in range(args.runs)])
+
+    # gatherdata, cold reads every file, warm reads through the tag index.
+    results['gatherdata'] = summary([timed(autoupload.gatherdata, release)[0] for i in range(args.runs)], files=args.tracks)
+    autoupload.tag_index = tagindex.TagIndex(os.path.join(work, 'tags.db'))
+    autoupload.gatherdata(release)
+    results['gatherdata_indexed'] = summary([timed(autoupload.gatherdata, release)[0] for i in range(args.runs)], files=args.tracks)
+    releasedata = autoupload.gatherdata(release)
+
+    # translate and detectlanguage are cheap, so each run times a loop over synthetic strings.
+    strings = [hangulwords(rng, rng.randint(1, 3)) for i in range(200)] + list(dictionary['genres']) + ['Various Artists', 'IU', '아이유 (IU)']
+    def translateall():
+        for string in strings:
+            autoupload.translate(string, 'genres')
+    def detectall():
+        for string in strings:
+            autoupload.detectlanguage(string)
+    results['translate'] = summary([timed(translateall)[0] for i in range(args.runs)], calls=len(strings))
+    results['detectlanguage'] = summary([timed(detectall)[0] for i in range(args.runs)], calls=len(strings))
+
+    # createtorrent, cold hashes every piece, cached reads the piece cache.
+    times = [timed(autoupload.createtorrent, autoupload.authkey, release, folder_name, releasedata)[0] for i in range(args.runs)]
+    results['createtorrent'] = summary(times, bytes=release_size, mb_per_second=release_size / 1048576 / min(times))
+    autoupload.piece_cache = piecehash.PieceCache(os.path.join(work, 'pieces'))
+    torrentname, torrentdata = autoupload.createtorrent(autoupload.authkey, release, folder_name, releasedata)
+    results['createtorrent_cached'] = summary([timed(autoupload.createtorrent, autoupload.authkey, release, folder_name, releasedata)[0] for i in range(args.runs)])
+
+    # cover, cold downscales the cover (when Pillow is installed), cached reads the cover cache.
+    release_manifest = manifest.scan(release)
+    results['cover'] = summary([timed(cover.prepare, release, cfg['local_prefs']['cover_name'], release_manifest, {})[0] for i in range(args.runs)])
+    cover_cache = cover.CoverCache(os.path.join(work, 'covers'))
+    cover.prepare(release, cfg['local_prefs']['cover_name'], release_manifest, {}, cover_cache)
+    results['cover_cached'] = summary([timed(cover.prepare, release, cfg['local_prefs']['cover_name'], release_manifest, {}, cover_cache)[0] for i in range(args.runs)])
+
+    release_cover = cover.prepare(release, cfg['local_prefs']['cover_name'], release_manifest, {}, cover_cache)
+    results['uploadtorrent'] = summary([timed(autoupload.uploadtorrent, torrentname, torrentdata, release_cover, releasedata)[0] for i in range(args.runs)],
+                                       cover_bytes=len(release_cover[1]))
+
+    # ftp_transfer, full sends every file, sync finds everything already on the server.
+    if ftp_port:
+        times = []
+        for i in range(args.runs):
+            shutil.rmtree(os.path.join(ftp_root, 'downloads', folder_name), ignore_errors=True)
+            times.append(timed(autoupload.ftp_transfer, torrentname, torrentdata, '/downloads', release, folder_name, '/watch')[0])
+        results['ftp_transfer'] = summary(times, bytes=release_size, mb_per_second=release_size / 1048576 / min(times))
+        results['ftp_transfer_sync'] = summary([timed(autoupload.ftp_transfer, torrentname, torrentdata, '/downloads', release, folder_name, '/watch')[0] for i in range(args.runs)])
+        ftp.close_all()
+    else:
+        results['ftp_transfer'] = {'skipped': 'pyftpdlib is not installed'}
+
+    tracker.shutdown()
+    shutil.rmtree(work, ignore_errors=True)
+
+    return results
+
+def printresults(results):
+    print("_" * 100)
+    print(f"{'Stage':<24}{'min (s)':>12}{'mean (s)':>12}{'max (s)':>12}")
+    for stage, result in results.items():
+        if 'skipped' in result:
+            print(f"{stage:<24}{'skipped: ' + result['skipped']:>36}")
+        else:
+            print(f"{stage:<24}{result['min']:>12.4f}{result['mean']:>12.4f}{result['max']:>12.4f}")
+
+if __name__ == "__main__":
+    args = getargs()
+    output = os.path.abspath(args.output)
+    results = run(args)
+    printresults(results)
+
+    report = {'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'python': platform.python_version(),
+              'platform': platform.platform(),
+              'cpus': os.cpu_count(),
+              'release': {'tracks': args.tracks, 'size_mb': args.size, 'format': args.format},
+              'runs': args.runs,
+              'stages': results}
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=4)
+    print(f"\nResults written to {output}")
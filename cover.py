@@ -0,0 +1,146 @@
+# Standard library packages
+import io
+import os
+import json
+import time
+import hashlib
+
+# JPS-AU files
+import profiler
+
+# Picture type of the front cover in FLAC pictures and ID3 APIC frames.
+front_cover = 3
+
+extensions = {'image/jpeg': 'jpg', 'image/jpg': 'jpg', 'image/png': 'png'}
+
+## Returns (data, mime type) of the art embedded in the first FLAC/MP3 file of a release that has any, or None.
+# The front cover is preferred over other pictures of the same file.
+def embedded(release_manifest):
+    for file in release_manifest.bykind('flac', 'mp3'):
+        if file.kind == 'flac':
+            from mutagen.flac import FLAC
+            pictures = [(p.type, p.data, p.mime) for p in FLAC(file.path).pictures]
+        else:
+            from mutagen.id3 import ID3, ID3NoHeaderError
+            try:
+                pictures = [(p.type, p.data, p.mime) for p in ID3(file.path).getall('APIC')]
+            except ID3NoHeaderError:
+                pictures = []
+        if pictures:
+            pictures.sort(key=lambda picture: picture[0] != front_cover)
+            return pictures[0][1], pictures[0][2]
+
+    return None
+
+## Downscales a cover to fit max_dimension and recompresses it to fit max_bytes, returns (data, extension).
+# Covers that already fit are returned as they are. Resizing needs Pillow (pip install Pillow),
+# without it or for images Pillow can't read the original is returned.
+def shrink(data, extension, max_dimension, max_bytes, quality=90):
+    try:
+        from PIL import Image
+    except ImportError:
+        return data, extension
+    try:
+        # Only the header is read here, the image is decoded by thumbnail().
+        image = Image.open(io.BytesIO(data))
+        if max(image.size) <= max_dimension and len(data) <= max_bytes:
+            return data, extension
+        with profiler.span('cover decode', 'cover', size=len(data)):
+            image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+    except (OSError, Image.DecompressionBombError):
+        return data, extension
+
+    with profiler.span('cover encode', 'cover'):
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        # Lower the quality until the cover fits, the last attempt is used even if it's still too large.
+        while True:
+            output = io.BytesIO()
+            image.save(output, 'JPEG', quality=quality, optimize=True)
+            if output.tell() <= max_bytes or quality <= 50:
+                break
+            quality -= 10
+
+    return output.getvalue(), 'jpg'
+
+## Covers that were already shrunk, keyed by the content hash of the original and the settings used.
+# Entries unused for longer than max_age_days are removed, then the least recently used until the cache fits in max_size_mb.
+class CoverCache:
+    def __init__(self, directory, max_age_days=30, max_size_mb=64):
+        self.directory = directory
+        self.max_age = max_age_days * 24 * 60 * 60
+        self.max_size = max_size_mb * 1024 * 1024
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, data, settings):
+        return hashlib.sha1(hashlib.sha1(data).digest() + json.dumps(settings).encode('utf-8')).hexdigest()
+
+    # Returns (data, extension) of a cached cover or None.
+    def get(self, key):
+        for extension in ['jpg', 'png']:
+            entry = os.path.join(self.directory, f"{key}.{extension}")
+            try:
+                with open(entry, 'rb') as f:
+                    data = f.read()
+            except FileNotFoundError:
+                continue
+            os.utime(entry)
+            return data, extension
+
+        return None
+
+    def put(self, key, data, extension):
+        entry = os.path.join(self.directory, f"{key}.{extension}")
+        with open(f"{entry}.tmp", 'wb') as f:
+            f.write(data)
+        os.replace(f"{entry}.tmp", entry)
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for e in os.scandir(self.directory):
+            if e.name.endswith(('.jpg', '.png')):
+                st = e.stat()
+                entries.append((st.st_mtime, st.st_size, e.path))
+        entries.sort()
+
+        now = time.time()
+        total = sum(size for mtime, size, path in entries)
+        for mtime, size, path in entries:
+            if now - mtime > self.max_age or total > self.max_size:
+                os.remove(path)
+                total -= size
+
+## Returns (filename, data) of the cover to upload with a release, or None if it has none.
+# The cover file is used if it exists, otherwise the art embedded in the audio files (if extract_embedded).
+@profiler.traced('cover')
+def prepare(directory, cover_name, release_manifest, cover_prefs, cache=None):
+    path = os.path.join(directory, cover_name)
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+        name, extension = os.path.splitext(cover_name)
+        extension = extension.lstrip('.').lower()
+    except FileNotFoundError:
+        found = embedded(release_manifest) if cover_prefs.get('extract_embedded', True) else None
+        if found == None:
+            return None
+        data, mime = found
+        name, extension = 'cover', extensions.get(mime.lower(), 'jpg')
+
+    if not cover_prefs.get('shrink', True):
+        return f"{name}.{extension}", data
+
+    settings = [cover_prefs.get('max_dimension', 1000), cover_prefs.get('max_kb', 500) * 1024, cover_prefs.get('quality', 90)]
+    key = cache.key(data, settings) if cache else None
+    cached = cache.get(key) if cache else None
+    if cached != None:
+        data, extension = cached
+    else:
+        original = data
+        data, extension = shrink(data, extension, *settings)
+        # Covers that were left as they are aren't cached, so they're shrunk once Pillow is installed.
+        if cache and data is not original:
+            cache.put(key, data, extension)
+
+    return f"{name}.{extension}", data
@@ -0,0 +1,200 @@
+# Standard library packages
+import os
+import json
+import tempfile
+import threading
+import unicodedata
+
+# JPS-AU files
+import profiler
+
+## Key normalization shared by every index: NFC, case folded and whitespace collapsed, so "IU", "iu " and "Iu" are one key.
+def normalize(string):
+    return ' '.join(unicodedata.normalize('NFC', str(string)).casefold().split())
+
+## Aho-Corasick automaton matching every pattern of a category in one pass over a string.
+# Patterns are normalized dictionary keys, matches are mapped back to character offsets of the original string.
+class PatternMatcher:
+    def __init__(self, patterns):
+        # Trie of goto transitions, failure links and the patterns ending at each node.
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+        for pattern, value in patterns.items():
+            node = 0
+            for c in pattern:
+                if c not in self.goto[node]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                    self.goto[node][c] = len(self.goto) - 1
+                node = self.goto[node][c]
+            self.output[node].append((len(pattern), value))
+
+        # Failure links point at the longest proper suffix that is also a prefix of some pattern, built breadth first.
+        queue = list(self.goto[0].values())
+        for node in queue:
+            for c, child in self.goto[node].items():
+                queue.append(child)
+                fallback = self.fail[node]
+                while fallback and c not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(c, 0)
+                self.output[child] = self.output[child] + self.output[self.fail[child]]
+
+    ## Returns (start, end, value) of the longest, leftmost and non-overlapping matches that are whole words.
+    # Offsets are into the NFC form of string.
+    def findall(self, string):
+        string = unicodedata.normalize('NFC', string)
+        # Normalize character by character, remembering the original offset of every normalized character.
+        text = []
+        offsets = []
+        for i, c in enumerate(string):
+            if c.isspace():
+                if text and text[-1] != ' ':
+                    text.append(' ')
+                    offsets.append(i)
+                continue
+            for folded in c.casefold():
+                text.append(folded)
+                offsets.append(i)
+        offsets.append(len(string))
+
+        matches = []
+        node = 0
+        for i, c in enumerate(text):
+            while node and c not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(c, 0)
+            for length, value in self.output[node]:
+                start = i - length + 1
+                # Skip matches inside a longer word, e.g. 이고 within 이고은.
+                if (start > 0 and text[start - 1].isalnum()) or (i + 1 < len(text) and text[i + 1].isalnum()):
+                    continue
+                matches.append((start, i + 1, value))
+
+        found = []
+        end = 0
+        for start, stop, value in sorted(matches, key=lambda match: (match[0], match[0] - match[1])):
+            if start >= end:
+                found.append((offsets[start], offsets[stop - 1] + 1, value))
+                end = stop
+
+        return found
+
+## In-memory copy of dictionary.json shared by translate() and add_to_hangul_dict().
+# The file is loaded once per process, new entries are applied in memory and written back in batches.
+# Writes go through a temporary file and a rename so a crash never leaves a half written dictionary.
+class DictionaryStore:
+    def __init__(self, path, flush_every=50):
+        self.path = path
+        self.flush_every = flush_every
+        self.lock = threading.RLock()
+        self.dictionary = None
+        self.mtime = None
+        # Entries added since the last flush as (category, hangul, english).
+        self.pending = []
+        # Per category: normalized key -> key, normalized English -> key and the matcher of keys with a translation.
+        self.forward = {}
+        self.reverse = {}
+        self.matchers = {}
+
+    def load(self):
+        with profiler.span('dictionary load', 'io'):
+            with open(self.path, encoding='utf-8', errors='ignore') as f:
+                self.dictionary = json.load(f, strict=False)
+        self.mtime = os.stat(self.path).st_mtime_ns
+        self.forward = {}
+        self.reverse = {}
+        self.matchers = {}
+
+    # Returns the entries of a category, loading the dictionary on first use.
+    # Categories missing from older dictionaries (e.g. titles) start out empty.
+    def category(self, category):
+        with self.lock:
+            if self.dictionary == None:
+                self.load()
+
+            return self.dictionary.setdefault(category, {})
+
+    def apply(self, hangul, english, category):
+        entries = self.dictionary.setdefault(category, {})
+        previous = entries.get(hangul)
+        # Only update existing entries if an English word has been supplied.
+        if english != 'None':
+            entries[hangul] = english
+        elif hangul not in entries:
+            entries[hangul] = None
+        else:
+            return
+        # Keep built indexes current.
+        if category in self.forward:
+            self.forward[category][normalize(hangul)] = hangul
+            if previous != None and self.reverse[category].get(normalize(previous)) == hangul:
+                del self.reverse[category][normalize(previous)]
+            if entries[hangul] != None:
+                self.reverse[category][normalize(entries[hangul])] = hangul
+        # The matcher only holds translated entries, it's rebuilt on its next use once one was added or changed.
+        if entries[hangul] != previous and (entries[hangul] != None or previous != None):
+            self.matchers.pop(category, None)
+
+    # Builds the forward and reverse index of a category on first use.
+    def index(self, category):
+        entries = self.category(category)
+        if category not in self.forward:
+            self.forward[category] = {normalize(key): key for key in entries}
+            self.reverse[category] = {normalize(value): key for key, value in entries.items() if value != None}
+
+        return entries
+
+    ## Returns the dictionary key matching a string once normalized, or None.
+    def find(self, string, category):
+        with self.lock:
+            self.index(category)
+
+            return self.forward[category].get(normalize(string))
+
+    # Returns the key whose English translation matches a string once normalized, or None.
+    def findreverse(self, string, category):
+        with self.lock:
+            self.index(category)
+
+            return self.reverse[category].get(normalize(string))
+
+    ## Finds every translated key of a category within a string, e.g. each artist of "A, B & C (feat. D)".
+    # Returns (start, end, english) for each match, see PatternMatcher.findall.
+    def findall(self, string, category):
+        with self.lock:
+            entries = self.index(category)
+            if category not in self.matchers:
+                self.matchers[category] = PatternMatcher({normalize(key): value for key, value in entries.items() if value != None})
+            matcher = self.matchers[category]
+
+        return matcher.findall(string)
+
+    def add(self, hangul, english, category):
+        with self.lock:
+            self.category(category)
+            self.apply(hangul, english, category)
+            self.pending.append((category, hangul, english))
+            if len(self.pending) >= self.flush_every:
+                self.flush()
+
+    def flush(self):
+        with self.lock:
+            if not self.pending:
+                return
+            # Another process may have written the file since we loaded it, pick up its entries first.
+            if os.stat(self.path).st_mtime_ns != self.mtime:
+                self.load()
+                for category, hangul, english in self.pending:
+                    self.apply(hangul, english, category)
+
+            directory = os.path.dirname(os.path.abspath(self.path))
+            with profiler.span('dictionary write', 'io', entries=len(self.pending)):
+                with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=directory, suffix='.tmp', delete=False) as f:
+                    f.write(json.dumps(self.dictionary, indent=4, ensure_ascii=False))
+                os.chmod(f.name, os.stat(self.path).st_mode)
+                os.replace(f.name, self.path)
+            self.mtime = os.stat(self.path).st_mtime_ns
+            self.pending = []
@@ -0,0 +1,203 @@
+# Standard library packages
+import os
+import time
+import ftplib
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# JPS-AU files
+import profiler
+
+# Opens a new FTP session using the ftp_prefs from config.json.
+def connect(ftp_prefs):
+    session = ftplib.FTP()
+    session.connect(ftp_prefs['ftp_server'], ftp_prefs.get('ftp_port', 21))
+    session.login(ftp_prefs['ftp_username'], ftp_prefs['ftp_password'])
+    # Set session encoding to utf-8 so we can properly handle hangul/other special characters
+    session.encoding = 'utf-8'
+
+    return session
+
+# Returns the size of a remote file or None if it doesn't exist (or the server doesn't support SIZE).
+def remotesize(session, name):
+    try:
+        session.voidcmd('TYPE I')
+        return session.size(name)
+    except ftplib.error_perm:
+        return None
+
+## Lists the files of a remote directory once and returns their sizes keyed by name.
+# MLSD is used where available, servers without it are listed with NLST and a SIZE per file.
+@profiler.traced('ftp')
+def listremote(session, remote_dir):
+    try:
+        return {name: int(facts['size']) for name, facts in session.mlsd(remote_dir, ['type', 'size']) if facts.get('type') == 'file'}
+    except ftplib.error_perm:
+        pass
+
+    remote = {}
+    try:
+        names = session.nlst(remote_dir)
+    except ftplib.error_perm:
+        # Directory doesn't exist yet or is empty.
+        return remote
+    for name in names:
+        name = os.path.basename(name)
+        size = remotesize(session, f"{remote_dir}/{name}")
+        if size != None:
+            remote[name] = size
+
+    return remote
+
+# Asks the server for a checksum of a remote file, returns (algorithm, hexdigest) or None if the server has no checksum command.
+def remotechecksum(session, path):
+    for command, algorithm in [('XSHA1', 'sha1'), ('XMD5', 'md5')]:
+        try:
+            return algorithm, session.sendcmd(f"{command} {path}").split()[-1].lower()
+        except ftplib.error_perm:
+            continue
+
+    return None
+
+def localchecksum(file_location, algorithm):
+    checksum = hashlib.new(algorithm)
+    with open(file_location, 'rb') as f:
+        for block in iter(lambda: f.read(1048576), b''):
+            checksum.update(block)
+
+    return checksum.hexdigest()
+
+## Decides which files have to be sent, comparing name and size with a single listing per remote directory.
+# Files already complete on the remote are skipped, smaller remote files are resumed.
+# If checksum is set, complete files are also compared by checksum where the server supports it.
+# files is a list of (file_location, name, size), names may contain subdirectories (CD1/01.flac).
+# Returns a list of (file_location, name, size, resume).
+def syncplan(session, remote_dir, files, checksum=False):
+    remote = {}
+    for subdirectory in sorted({os.path.dirname(name) for file_location, name, size in files}):
+        listing = listremote(session, f"{remote_dir}/{subdirectory}" if subdirectory else remote_dir)
+        remote.update({f"{subdirectory}/{name}" if subdirectory else name: size for name, size in listing.items()})
+    plan = []
+    for file_location, name, size in files:
+        remote_size = remote.get(name)
+        if remote_size == size:
+            if checksum:
+                remote_checksum = remotechecksum(session, f"{remote_dir}/{name}")
+                if remote_checksum == None:
+                    print("Server doesn't support XSHA1/XMD5, files are compared by size only")
+                    checksum = False
+                elif localchecksum(file_location, remote_checksum[0]) != remote_checksum[1]:
+                    plan.append((file_location, name, size, False))
+                    continue
+            print(f"{name} | Already on server, skipped")
+        elif remote_size != None and remote_size < size:
+            plan.append((file_location, name, size, True))
+        else:
+            plan.append((file_location, name, size, False))
+
+    return plan
+
+## Uploads a single file, continuing from the end of the remote copy if resume is set.
+# REST is only used when the remote copy is smaller than our file, anything else is uploaded from scratch.
+# Returns the offset the upload started from.
+def uploadfile(session, file_location, name, blocksize, callback, resume=False, size=None):
+    rest = 0
+    if resume:
+        rest = remotesize(session, name) or 0
+        if rest > (size if size != None else os.path.getsize(file_location)):
+            rest = 0
+
+    with open(file_location, 'rb') as f:
+        f.seek(rest)
+        with profiler.span(f"STOR {name}", 'ftp', rest=rest):
+            session.storbinary(f"STOR {name}", f, blocksize, callback=callback, rest=rest or None)
+
+    return rest
+
+## Uploads files into remote_dir over several FTP connections at once.
+# files is a list of (file_location, name, size), the subdirectories of names must already exist on the remote. Each worker thread keeps its connection open between files,
+# if a transfer drops the connection is reopened and the file resumed with REST after a backoff.
+# With ftp_sync enabled only files missing or different on the remote are sent, the listing is made with session.
+# completed is called with the name of each file once it's on the remote.
+def transferfiles(ftp_prefs, remote_dir, files, desc=None, session=None, completed=None):
+    from tqdm import tqdm
+
+    if ftp_prefs.get('ftp_sync', True):
+        listing_session = session or connect(ftp_prefs)
+        plan = syncplan(listing_session, remote_dir, files, ftp_prefs.get('ftp_sync_checksum', False))
+        if session == None:
+            listing_session.quit()
+    else:
+        plan = [(file_location, name, size, False) for file_location, name, size in files]
+
+    connections = ftp_prefs.get('ftp_connections', 4)
+    blocksize = ftp_prefs.get('ftp_block_size', 1048576)
+    retries = ftp_prefs.get('ftp_retries', 3)
+    backoff = ftp_prefs.get('ftp_retry_backoff', 2)
+
+    local = threading.local()
+    sessions = []
+    sessions_lock = threading.Lock()
+
+    def getsession():
+        if getattr(local, 'session', None) == None:
+            session = connect(ftp_prefs)
+            with sessions_lock:
+                sessions.append(session)
+            session.cwd(remote_dir)
+            local.session = session
+        return local.session
+
+    total = sum(size for file_location, name, size, resume in plan)
+    with tqdm(unit = 'B', unit_scale = True, leave = False, miniters = 1, desc = desc or f'Uploading [{remote_dir}]', total = total) as tqdm_instance:
+
+        def transfer(file_location, name, size, resume):
+            # Bytes of this file counted on the progress bar.
+            counted = 0
+            start = time.time()
+            for attempt in range(retries + 1):
+                # Take back what an interrupted attempt counted, the resumed attempt only sends bytes after the remote offset.
+                tqdm_instance.update(-counted)
+                counted = 0
+                try:
+                    def progress(block):
+                        nonlocal counted
+                        counted += len(block)
+                        tqdm_instance.update(len(block))
+                    # Resume partial remote files and any attempt after an interrupted one.
+                    rest = uploadfile(getsession(), file_location, name, blocksize, progress, resume=resume or attempt > 0, size=size)
+                    break
+                except ftplib.all_errors as e:
+                    if attempt == retries:
+                        raise
+                    tqdm.write(f"{name} | Transfer interrupted ({e}), retrying in {backoff * 2 ** attempt}s")
+                    if getattr(local, 'session', None) != None:
+                        with sessions_lock:
+                            sessions.remove(local.session)
+                        local.session.close()
+                        local.session = None
+                    time.sleep(backoff * 2 ** attempt)
+
+            # A resumed upload only counts the bytes sent after the remote offset, settle the file's total.
+            tqdm_instance.update(size - counted)
+            elapsed = time.time() - start
+            tqdm.write(f"{name} | Complete! {(size - rest) / 1048576 / max(elapsed, 0.001):.2f} MB/s")
+            if completed:
+                completed(name)
+            return size - rest
+
+        start = time.time()
+        with ThreadPoolExecutor(max_workers=connections) as executor:
+            sent = sum(executor.map(lambda f: transfer(*f), plan))
+        elapsed = time.time() - start
+
+    for session in sessions:
+        try:
+            session.quit()
+        except ftplib.all_errors:
+            session.close()
+
+    print(f"Transferred {sent / 1048576:.2f} MB in {elapsed:.1f}s | {sent / 1048576 / max(elapsed, 0.001):.2f} MB/s over {min(connections, len(plan))} connections")
+
+    return sent
@@ -0,0 +1,36 @@
+# Standard library packages
+import os
+import json
+import time
+import threading
+
+## Persistent journal of the stages each release has completed.
+# Every stage is recorded as soon as it finishes (tags read, torrent built, POST accepted, each FTP file,
+# placement), so a run that dies halfway is continued from the last completed stage instead of POSTing twice
+# or leaving a torrent that is never seeded. A release's entries are removed once all of its stages are done.
+class JobJournal:
+    def __init__(self, path):
+        import sqlite3
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Batch runs record stages from worker threads, every query goes through the lock.
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS stages (directory TEXT, stage TEXT, data TEXT, completed REAL, PRIMARY KEY (directory, stage))")
+
+    # Returns the data recorded by each completed stage of a release keyed by stage name.
+    def stages(self, directory):
+        with self.lock:
+            rows = self.connection.execute("SELECT stage, data FROM stages WHERE directory = ?", (os.path.abspath(directory),)).fetchall()
+
+        return {stage: json.loads(data) for stage, data in rows}
+
+    def record(self, directory, stage, data=None):
+        with self.lock, self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO stages VALUES (?, ?, ?, ?)",
+                                    (os.path.abspath(directory), stage, json.dumps(data, ensure_ascii=False), time.time()))
+
+    def clear(self, directory):
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM stages WHERE directory = ?", (os.path.abspath(directory),))
@@ -0,0 +1,97 @@
+# Standard library packages
+import os
+import re
+import json
+import time
+import threading
+
+# JPS-AU files
+import profiler
+from dictstore import normalize
+
+# "Artist: ..." and "Album: ..." lines in the header of a log, BBCode tags are removed first.
+header_fields = re.compile(r'^\s*(artist|album|title|아티스트|앨범)\s*[:：]\s*(.+?)\s*$', re.IGNORECASE | re.MULTILINE)
+bbcode = re.compile(r'\[/?[^\]]*\]')
+header_bytes = 4096
+
+## Returns the "Artist - Title" a log names in its header, or None.
+def readheader(path):
+    try:
+        with open(path, encoding='utf-8', errors='replace') as f:
+            header = bbcode.sub('', f.read(header_bytes))
+    except OSError:
+        return None
+    fields = {}
+    for name, value in header_fields.findall(header):
+        name = {'아티스트': 'artist', '앨범': 'album', 'title': 'album'}.get(name.lower(), name.lower())
+        fields.setdefault(name, value)
+
+    return f"{fields['artist']} - {fields['album']}" if 'artist' in fields and 'album' in fields else None
+
+## Persistent index of the .log files in log directories, keyed by normalized file name without extension.
+# BugsPy names its logs after the album id, tracklists saved by JPS-AU are named "Artist - Title".
+# Logs are also indexed by the "Artist - Title" of their header (artist/album lines), so a release without
+# an album id in its comment tag still finds its BugsPy log. Each log's header is read once, when it first appears.
+# A directory is only listed again once its mtime changes (a file was added, removed or renamed),
+# so lookups against a log folder on a slow network share cost at most one stat every refresh_seconds.
+class LogIndex:
+    def __init__(self, path, refresh_seconds=60):
+        self.path = path
+        self.refresh_seconds = refresh_seconds
+        self.lock = threading.Lock()
+        try:
+            with open(path, encoding='utf-8') as f:
+                self.directories = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self.directories = {}
+        # Directory -> time this process last compared its mtime.
+        self.checked = {}
+
+    def save(self):
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(f"{self.path}.tmp", 'w', encoding='utf-8') as f:
+            json.dump(self.directories, f, ensure_ascii=False)
+        os.replace(f"{self.path}.tmp", self.path)
+
+    # Lists the directory again if it changed since it was indexed and returns its entries.
+    def refresh(self, directory):
+        key = os.path.abspath(directory)
+        if time.time() - self.checked.get(key, 0) < self.refresh_seconds:
+            return self.directories[key]['logs']
+
+        mtime = os.stat(directory).st_mtime_ns
+        indexed = self.directories.get(key, {})
+        if indexed.get('mtime') != mtime or 'headers' not in indexed:
+            with profiler.span('log index refresh', 'io'):
+                logs = {}
+                # File name -> "Artist - Title" of its header, carried over for logs that were already indexed.
+                headers = {}
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if entry.name.lower().endswith('.log') and entry.is_file():
+                            logs[normalize(entry.name[:-4])] = entry.name
+                            if entry.name in indexed.get('headers', {}):
+                                headers[entry.name] = indexed['headers'][entry.name]
+                            else:
+                                headers[entry.name] = readheader(entry.path)
+                # File names take precedence over headers.
+                for name, header in headers.items():
+                    if header:
+                        logs.setdefault(normalize(header), name)
+            self.directories[key] = {'mtime': mtime, 'logs': logs, 'headers': headers}
+            self.save()
+        self.checked[key] = time.time()
+
+        return self.directories[key]['logs']
+
+    ## Returns the path of the first log matching one of the names, e.g. the album id then "Artist - Title", or None.
+    def find(self, directory, names):
+        with self.lock:
+            logs = self.refresh(directory)
+            for name in names:
+                if name and normalize(name) in logs:
+                    return os.path.join(directory, logs[normalize(name)])
+
+        return None
+
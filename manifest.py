@@ -0,0 +1,71 @@
+# Standard library packages
+import os
+import collections
+
+# JPS-AU files
+import profiler
+
+# Kind of each file by extension, anything else is 'other'.
+file_kinds = {'.flac': 'flac', '.mp3': 'mp3', '.log': 'log', '.jpg': 'image', '.jpeg': 'image', '.png': 'image'}
+
+## A file of a release. relpath always uses / so it can be used for FTP paths and journal keys on any OS.
+ManifestFile = collections.namedtuple('ManifestFile', ['path', 'relpath', 'size', 'mtime', 'kind'])
+
+## Immutable list of the files of a release, made by a single recursive os.scandir pass.
+# Every stage (tag reading, piece layout, FTP, placement, plans and the journal) works from the manifest
+# instead of listing and stat'ing the release again, which matters on NAS mounted libraries.
+# Files are sorted by relative path, so CD1/01.flac comes before CD2/01.flac.
+class Manifest:
+    def __init__(self, directory, files):
+        self.directory = directory
+        self.files = tuple(sorted(files, key=lambda file: file.relpath))
+        # Files keyed by absolute path, for looking up the files torf lists.
+        self.bypath = {os.path.abspath(file.path): file for file in self.files}
+
+    @property
+    def size(self):
+        return sum(file.size for file in self.files)
+
+    def bykind(self, *kinds):
+        return [file for file in self.files if file.kind in kinds]
+
+    # Subdirectories holding files, parents before children, e.g. ['CD1', 'CD2'].
+    def subdirectories(self):
+        directories = set()
+        for file in self.files:
+            parent = os.path.dirname(file.relpath)
+            while parent:
+                directories.add(parent)
+                parent = os.path.dirname(parent)
+
+        return sorted(directories, key=lambda directory: (directory.count('/'), directory))
+
+    # Size and mtime of every file keyed by relative path, see releaseplan.
+    def fingerprint(self):
+        return {file.relpath: [file.size, file.mtime] for file in self.files}
+
+## Scans a release directory and everything below it.
+# Files removed while scanning are skipped. Like os.walk, symlinks to files are followed and symlinks
+# to directories aren't, so a link loop inside a release can't make the scan run forever.
+def scan(directory):
+    files = []
+    with profiler.span('directory scan', 'io', directory=directory):
+        pending = ['']
+        while pending:
+            relative = pending.pop()
+            with os.scandir(os.path.join(directory, relative)) as entries:
+                for entry in entries:
+                    relpath = f"{relative}/{entry.name}" if relative else entry.name
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            pending.append(relpath)
+                            continue
+                        if not entry.is_file():
+                            continue
+                        st = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    kind = file_kinds.get(os.path.splitext(entry.name)[1].lower(), 'other')
+                    files.append(ManifestFile(entry.path, relpath, st.st_size, st.st_mtime_ns, kind))
+
+    return Manifest(directory, files)
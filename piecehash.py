@@ -0,0 +1,167 @@
+# Standard library packages
+import os
+import time
+import json
+import hashlib
+
+# JPS-AU files
+import profiler
+
+# Number of pieces handed to a worker at a time, small enough to keep progress updates regular.
+chunk_pieces = 64
+
+# Lists the files of a torrent in info dict order along with their size and offset in the piece stream.
+# Sizes are taken from the release manifest if one is given, see manifest.py.
+def filelayout(torrent, manifest=None):
+    layout = []
+    offset = 0
+    for path in torrent.filepaths:
+        file = manifest.bypath.get(os.path.abspath(path)) if manifest else None
+        size = file.size if file else os.path.getsize(path)
+        layout.append((str(path), size, offset))
+        offset += size
+
+    return layout, offset
+
+## Hashes pieces first..last-1 of the piece stream and returns the concatenated SHA1 digests.
+# Pieces span file boundaries, so each read is capped at the end of the current piece and the current file.
+def hashpieces(layout, total_size, piece_size, first, last):
+    start = first * piece_size
+    end = min(last * piece_size, total_size)
+    digests = []
+    piece = hashlib.sha1()
+    filled = 0
+
+    for path, size, offset in layout:
+        # Skip files that lie completely outside of our range.
+        if offset + size <= start or offset >= end:
+            continue
+        remaining = min(offset + size, end) - max(offset, start)
+        with open(path, 'rb', buffering=0) as f:
+            f.seek(max(start - offset, 0))
+            while remaining:
+                data = f.read(min(piece_size - filled, remaining))
+                if not data:
+                    raise OSError(f"{path} is shorter than expected, was it modified while hashing?")
+                piece.update(data)
+                filled += len(data)
+                remaining -= len(data)
+                if filled == piece_size:
+                    digests.append(piece.digest())
+                    piece = hashlib.sha1()
+                    filled = 0
+
+    # Last piece of the torrent is usually shorter than piece_size.
+    if filled:
+        digests.append(piece.digest())
+
+    return b''.join(digests)
+
+## On-disk cache of the pieces of previously hashed releases.
+# Entries are keyed by the path, size and mtime of every file plus the piece length,
+# so any change to the files or piece size results in a miss and a full rehash.
+class PieceCache:
+    def __init__(self, directory, max_age_days=30, max_size_mb=256):
+        self.directory = directory
+        self.max_age = max_age_days * 24 * 60 * 60
+        self.max_size = max_size_mb * 1024 * 1024
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, layout, piece_size, manifest=None):
+        files = []
+        for path, size, offset in layout:
+            file = manifest.bypath.get(os.path.abspath(path)) if manifest else None
+            files.append((os.path.abspath(path), size, file.mtime if file else os.stat(path).st_mtime_ns))
+        return hashlib.sha1(json.dumps([piece_size, files]).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        entry = os.path.join(self.directory, f"{key}.pieces")
+        try:
+            with open(entry, 'rb') as f:
+                pieces = f.read()
+        except FileNotFoundError:
+            return None
+        # Refresh the mtime so eviction removes the least recently used entries first.
+        os.utime(entry)
+
+        return pieces
+
+    def put(self, key, pieces):
+        # Write to a temporary file first so an interrupted run never leaves a truncated entry.
+        entry = os.path.join(self.directory, f"{key}.pieces")
+        with open(f"{entry}.tmp", 'wb') as f:
+            f.write(pieces)
+        os.replace(f"{entry}.tmp", entry)
+        self.evict()
+
+    # Removes entries older than max_age, then the least recently used until the cache fits in max_size.
+    def evict(self):
+        entries = []
+        for e in os.scandir(self.directory):
+            if e.name.endswith('.pieces'):
+                st = e.stat()
+                entries.append((st.st_mtime, st.st_size, e.path))
+        entries.sort()
+
+        now = time.time()
+        total = sum(size for mtime, size, path in entries)
+        for mtime, size, path in entries:
+            if now - mtime > self.max_age or total > self.max_size:
+                os.remove(path)
+                total -= size
+
+## Hashes every piece of a torf Torrent across a process pool and stores the result in its info dict.
+# The info dict is identical to the one created by Torrent.generate().
+# callback(hashed, total) is called with the number of pieces hashed so far.
+# If a PieceCache is given, unchanged releases are read from it instead of being hashed again.
+def generate(torrent, workers=None, callback=None, cache=None, manifest=None):
+    with profiler.span('hashing', 'hash', size=torrent.size):
+        return generatepieces(torrent, workers, callback, cache, manifest)
+
+def generatepieces(torrent, workers, callback, cache, manifest=None):
+    layout, total_size = filelayout(torrent, manifest)
+    piece_size = torrent.piece_size
+    total_pieces = -(-total_size // piece_size)
+
+    if cache:
+        key = cache.key(layout, piece_size, manifest)
+        pieces = cache.get(key)
+        if pieces is not None and len(pieces) == total_pieces * 20:
+            torrent.metainfo['info']['pieces'] = pieces
+            if callback:
+                callback(total_pieces, total_pieces)
+            return torrent
+
+    chunks = [(first, min(first + chunk_pieces, total_pieces)) for first in range(0, total_pieces, chunk_pieces)]
+    workers = workers or os.cpu_count() or 1
+
+    results = {}
+    hashed = 0
+    # Avoid the cost of starting processes when there is nothing to split.
+    if workers == 1 or len(chunks) <= 1:
+        for first, last in chunks:
+            results[first] = hashpieces(layout, total_size, piece_size, first, last)
+            hashed += last - first
+            if callback:
+                callback(hashed, total_pieces)
+    else:
+        # multiprocessing is only imported when the pool is actually used.
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+        # Batch runs create the pool from worker threads, a forked child could inherit a lock (sqlite, tqdm, stdout)
+        # held by another thread and deadlock. forkserver starts children from a clean process, spawn where it's unavailable.
+        method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        with ProcessPoolExecutor(max_workers=min(workers, len(chunks)), mp_context=multiprocessing.get_context(method)) as executor:
+            futures = {executor.submit(hashpieces, layout, total_size, piece_size, first, last): (first, last) for first, last in chunks}
+            for future in as_completed(futures):
+                first, last = futures[future]
+                results[first] = future.result()
+                hashed += last - first
+                if callback:
+                    callback(hashed, total_pieces)
+
+    torrent.metainfo['info']['pieces'] = b''.join(results[first] for first, last in chunks)
+    if cache:
+        cache.put(key, torrent.metainfo['info']['pieces'])
+
+    return torrent
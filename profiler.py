@@ -0,0 +1,111 @@
+# Standard library packages
+import os
+import io
+import json
+import time
+import threading
+import functools
+import contextlib
+
+## Timing of stages and sub-steps for --profile.
+# Spans are only recorded once enable() has been called, otherwise span() costs a single check.
+enabled = False
+events = []
+events_lock = threading.Lock()
+start_time = time.perf_counter()
+# Name of the stage to run under cProfile and the stats collected for it.
+profile_stage = None
+profile_stats = None
+
+def enable(stage=None):
+    global enabled, profile_stage, start_time
+    enabled = True
+    profile_stage = stage
+    start_time = time.perf_counter()
+
+## Records the time spent in the with block as a complete event of the Chrome trace format.
+# The stage picked with --profile-stage is also run under cProfile.
+@contextlib.contextmanager
+def span(name, category, **args):
+    if not enabled:
+        yield
+        return
+
+    global profile_stats
+    profile = None
+    if name == profile_stage and category == 'stage':
+        import cProfile
+        profile = cProfile.Profile()
+        profile.enable()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        if profile:
+            profile.disable()
+            with events_lock:
+                if profile_stats == None:
+                    import pstats
+                    profile_stats = pstats.Stats(profile)
+                else:
+                    profile_stats.add(profile)
+        with events_lock:
+            events.append({'name': name, 'cat': category, 'ph': 'X', 'pid': os.getpid(),
+                           'tid': threading.get_ident(), 'ts': (start - start_time) * 1e6,
+                           'dur': (end - start) * 1e6, 'args': args})
+
+# Decorator recording every call of a function as a span named after it.
+def traced(category):
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(function.__name__, category):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+# Writes the recorded spans as a Chrome trace, open it in chrome://tracing or https://ui.perfetto.dev
+def writetrace(path):
+    with events_lock:
+        trace = list(events)
+    threads = {event['tid'] for event in trace}
+    names = {thread.ident: thread.name for thread in threading.enumerate()}
+    for tid in threads:
+        trace.append({'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': tid, 'args': {'name': names.get(tid, str(tid))}})
+    with open(path, 'w') as f:
+        json.dump({'traceEvents': trace, 'displayTimeUnit': 'ms'}, f)
+
+## Prints the time spent per span name, grouped by category.
+def printsummary():
+    totals = {}
+    with events_lock:
+        for event in events:
+            key = (event['cat'], event['name'])
+            count, total, longest = totals.get(key, (0, 0, 0))
+            totals[key] = (count + 1, total + event['dur'] / 1e6, max(longest, event['dur'] / 1e6))
+
+    print("_" * 100)
+    print("Profile:\n")
+    print(f"{'Category':<10}{'Step':<40}{'Calls':>8}{'Total (s)':>12}{'Mean (s)':>12}{'Max (s)':>12}")
+    for (category, name), (count, total, longest) in sorted(totals.items(), key=lambda item: (item[0][0], -item[1][1])):
+        print(f"{category:<10}{name[:39]:<40}{count:>8}{total:>12.4f}{total / count:>12.4f}{longest:>12.4f}")
+
+    if profile_stats:
+        output = io.StringIO()
+        profile_stats.stream = output
+        profile_stats.sort_stats('cumulative').print_stats(25)
+        print("_" * 100)
+        print(f"cProfile of {profile_stage}:\n")
+        print(output.getvalue())
+
+# Prints the summary and writes the trace, registered with atexit so failed runs are profiled too.
+def finish(trace_path):
+    if not enabled:
+        return
+    printsummary()
+    if trace_path:
+        writetrace(trace_path)
+        print(f"Trace written to {trace_path}")
+    if profile_stats:
+        profile_stats.dump_stats(f"{os.path.splitext(trace_path or 'profile')[0]}_{profile_stage}.prof")
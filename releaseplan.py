@@ -0,0 +1,56 @@
+# Standard library packages
+import os
+import io
+import json
+import time
+import base64
+
+# JPS-AU files
+import manifest
+
+## Plans written by --dryrun and uploaded with --apply.
+# A plan holds everything the upload stages need for each release: the releasedata (including the tracklist
+# and any answers given to the interactive questions), the torrent and a fingerprint of every file,
+# so applying it skips tag reading, translation and hashing entirely.
+plan_version = 1
+
+# Returns the size and mtime of every file below directory keyed by relative path.
+def fingerprint(directory):
+    return manifest.scan(directory).fingerprint()
+
+def makeentry(directory, releasedata, torrentname, torrentdata, announce, files=None):
+    return {'directory': os.path.abspath(directory), 'releasedata': releasedata, 'torrentname': torrentname,
+            'torrentdata': torrentdata, 'announce': announce, 'files': files or fingerprint(directory)}
+
+# Lists the files that were added, removed or modified since the plan entry was made.
+def changedfiles(entry):
+    current = fingerprint(entry['directory']) if os.path.isdir(entry['directory']) else {}
+    planned = entry['files']
+
+    return sorted(path for path in set(current) | set(planned) if current.get(path) != planned.get(path))
+
+## Points a planned torrent at a new announce URL, e.g. after the passkey was reset.
+# The announce URL isn't part of the info dict, so the info hash and pieces stay the same.
+def reannounce(torrentdata, announce):
+    from torf import Torrent
+    t = Torrent.read_stream(io.BytesIO(torrentdata))
+    t.trackers = [announce]
+
+    return t.dump()
+
+def save(path, entries):
+    plan = {'version': plan_version, 'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'releases': [dict(entry, torrentdata=base64.b64encode(entry['torrentdata']).decode('ascii')) for entry in entries]}
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f"{path}.tmp", 'w', encoding='utf-8') as f:
+        json.dump(plan, f, ensure_ascii=False, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+def load(path):
+    with open(path, encoding='utf-8') as f:
+        plan = json.load(f)
+    if plan.get('version') != plan_version:
+        raise ValueError(f"{path} is a version {plan.get('version')} plan, this version of JPS-AU reads version {plan_version}")
+
+    return [dict(entry, torrentdata=base64.b64decode(entry['torrentdata'])) for entry in plan['releases']]
@@ -0,0 +1,104 @@
+# Standard library packages
+import os
+import json
+import threading
+
+## Hangul to Revised Romanization.
+# Syllables are decomposed arithmetically (U+AC00 + (initial * 21 + medial) * 28 + final),
+# final consonants are carried over to a following syllable that starts with a silent ㅇ (음악 -> eumak)
+# and ㄹㄹ becomes ll. Other sound changes (nasalization, aspiration) aren't applied, so the result is a
+# consistent spelling rather than a pronunciation guide.
+initials = ['g', 'kk', 'n', 'd', 'tt', 'r', 'm', 'b', 'pp', 's', 'ss', '', 'j', 'jj', 'ch', 'k', 't', 'p', 'h']
+medials = ['a', 'ae', 'ya', 'yae', 'eo', 'e', 'yeo', 'ye', 'o', 'wa', 'wae', 'oe', 'yo', 'u', 'wo', 'we', 'wi', 'yu', 'eu', 'ui', 'i']
+# Final consonant as pronounced at the end of a syllable.
+finals = ['', 'k', 'k', 'k', 'n', 'n', 'n', 't', 'l', 'k', 'm', 'l', 'l', 'l', 'p', 'l', 'm', 'p', 'p', 't', 't', 'ng', 't', 't', 'k', 't', 'p', 't']
+# Final consonant split into what stays and what moves to a following silent ㅇ.
+carried = [('', ''), ('', 'g'), ('', 'kk'), ('k', 's'), ('', 'n'), ('n', 'j'), ('n', ''), ('', 'd'), ('', 'r'), ('l', 'g'),
+           ('l', 'm'), ('l', 'b'), ('l', 's'), ('l', 't'), ('l', 'p'), ('l', ''), ('', 'm'), ('', 'b'), ('p', 's'), ('', 's'),
+           ('', 'ss'), ('ng', ''), ('', 'j'), ('', 'ch'), ('', 'k'), ('', 't'), ('', 'p'), ('', '')]
+
+def ishangul(c):
+    return 0xAC00 <= ord(c) <= 0xD7A3
+
+def romanizeword(word):
+    syllables = [divmod(ord(c) - 0xAC00, 28) if ishangul(c) else None for c in word]
+    output = []
+    carry = None
+    for i, c in enumerate(word):
+        if syllables[i] == None:
+            output.append(c)
+            carry = None
+            continue
+        block, final = syllables[i]
+        initial, medial = divmod(block, 21)
+        following = syllables[i + 1] if i + 1 < len(word) else None
+        following_initial = following[0] // 21 if following else None
+
+        output.append(carry if carry != None else initials[initial])
+        output.append(medials[medial])
+        carry = None
+        if final and following_initial == 11:
+            stays, moves = carried[final]
+            output.append(stays)
+            carry = moves
+        elif finals[final] == 'l' and following_initial == 5:
+            # ㄹㄹ is written ll, the following ㄹ is romanized with the final.
+            output.append('l')
+            carry = 'l'
+        else:
+            output.append(finals[final])
+
+    return ''.join(output)
+
+## Romanizes the Hangul of a string word by word and capitalizes each romanized word, everything else is kept as is.
+def romanize(string):
+    words = []
+    for word in string.split(' '):
+        if any(ishangul(c) for c in word):
+            word = romanizeword(word)
+            # Capitalize the first letter even if the word starts with punctuation, e.g. (사랑) -> (Sarang)
+            for i, c in enumerate(word):
+                if c.isalpha():
+                    word = word[:i] + c.upper() + word[i + 1:]
+                    break
+        words.append(word)
+
+    return ' '.join(words)
+
+## Per-release answers written by the user, a JSON file named after the release folder.
+# They're kept in override_directory rather than the release folder, so they never end up in the torrent.
+# "type", "title" and "artist" answer the questions gatherdata would otherwise ask,
+# any other key replaces the releasedata field of the same name.
+def overridepath(override_directory, directory):
+    return os.path.join(override_directory, f"{os.path.basename(os.path.normpath(directory))}.json")
+
+def readoverrides(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+review_lock = threading.Lock()
+
+## Adds a release to the review queue with the questions that couldn't be answered.
+# The queue is a JSON file of directory -> {question: value found in the tags}, answering them in the
+# release's override file and running it again removes it from the queue.
+def queueforreview(path, directory, questions):
+    with review_lock:
+        try:
+            with open(path, encoding='utf-8') as f:
+                queue = json.load(f)
+        except FileNotFoundError:
+            queue = {}
+        if questions:
+            queue[os.path.abspath(directory)] = questions
+        elif os.path.abspath(directory) in queue:
+            del queue[os.path.abspath(directory)]
+        else:
+            return
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(f"{path}.tmp", 'w', encoding='utf-8') as f:
+            json.dump(queue, f, ensure_ascii=False, indent=4)
+        os.replace(f"{path}.tmp", path)
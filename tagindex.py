@@ -0,0 +1,33 @@
+# Standard library packages
+import os
+import json
+import threading
+
+## Persistent index of the tags read from audio files.
+# Entries are keyed by path and only returned while the size and mtime of the file are unchanged,
+# so re-runs and dry runs only open files that were modified since they were last read.
+class TagIndex:
+    def __init__(self, path):
+        import sqlite3
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Batch runs call gatherdata from worker threads, every query goes through the lock.
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS tags (path TEXT PRIMARY KEY, size INTEGER, mtime INTEGER, tags TEXT)")
+
+    # Returns the stored tags of a file or None if the file changed or was never indexed, mtime is in nanoseconds.
+    def get(self, path, size, mtime):
+        with self.lock:
+            row = self.connection.execute("SELECT size, mtime, tags FROM tags WHERE path = ?", (os.path.abspath(path),)).fetchone()
+        if row is None or row[0] != size or row[1] != mtime:
+            return None
+
+        return json.loads(row[2])
+
+    # Stores the tags of several files at once, entries is a list of (path, size, mtime, tags).
+    def put(self, entries):
+        rows = [(os.path.abspath(path), size, mtime, json.dumps(tags, ensure_ascii=False)) for path, size, mtime, tags in entries]
+        with self.lock, self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO tags VALUES (?, ?, ?, ?)", rows)
@@ -0,0 +1,66 @@
+# Standard library packages
+import io
+import os
+import re
+import json
+import time
+import threading
+import unicodedata
+
+## Normalizes artist/title/format/media so spacing, case, width and punctuation differences still match.
+def normalize(value):
+    value = unicodedata.normalize('NFKC', str(value or '')).casefold()
+
+    return re.sub(r'[\W_]+', '', value)
+
+def releasekey(releasedata):
+    return "|".join(normalize(releasedata.get(field)) for field in ['artist', 'title', 'format', 'media'])
+
+# Info hash of a bencoded torrent, the same files always hash to the same value whatever the torrent is named.
+def infohash(torrentdata):
+    from torf import Torrent
+
+    return Torrent.read_stream(io.BytesIO(torrentdata)).infohash
+
+## Persistent index of the releases uploaded from this machine and of previous tracker searches.
+# Releases are keyed by their normalized artist/title/format/media and also looked up by info hash,
+# so a dupe is caught right after gatherdata, before createtorrent spends minutes hashing.
+class UploadIndex:
+    def __init__(self, path):
+        import sqlite3
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Batch runs upload from worker threads, every query goes through the lock.
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS uploads (key TEXT PRIMARY KEY, infohash TEXT, directory TEXT, uploaded REAL)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS uploads_infohash ON uploads (infohash)")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS searches (query TEXT PRIMARY KEY, results TEXT, searched REAL)")
+
+    # Returns (directory, time of upload) of a previous upload of the same release or with the same info hash, else None.
+    def find(self, releasedata, infohash=None):
+        with self.lock:
+            row = self.connection.execute("SELECT directory, uploaded FROM uploads WHERE key = ? OR infohash = ?",
+                                          (releasekey(releasedata), infohash)).fetchone()
+
+        return row
+
+    def put(self, releasedata, infohash, directory):
+        with self.lock, self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO uploads VALUES (?, ?, ?, ?)",
+                                    (releasekey(releasedata), infohash, os.path.abspath(directory), time.time()))
+
+    # Returns the cached results of a tracker search or None if it's older than ttl seconds or was never made.
+    def getsearch(self, query, ttl):
+        with self.lock:
+            row = self.connection.execute("SELECT results, searched FROM searches WHERE query = ?", (normalize(query),)).fetchone()
+        if row is None or time.time() - row[1] >= ttl:
+            return None
+
+        return json.loads(row[0])
+
+    def putsearch(self, query, results):
+        with self.lock, self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO searches VALUES (?, ?, ?)",
+                                    (normalize(query), json.dumps(results, ensure_ascii=False), time.time()))
@@ -0,0 +1,196 @@
+# Standard library packages
+import os
+import sys
+import time
+import json
+import ctypes
+import select
+import struct
+
+# JPS-AU files
+import manifest
+import resolve
+
+# inotify event flags, see inotify(7)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_ISDIR = 0x40000000
+watch_mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+# Files that are still being written by the ripper or a download client.
+partial_extensions = ('.part', '.tmp', '.!qb', '.crdownload')
+
+## Minimal inotify wrapper using libc through ctypes, only available on Linux.
+class Inotify:
+    def __init__(self):
+        # ctypes.CDLL(None) raises TypeError on Windows instead of OSError.
+        if not sys.platform.startswith('linux'):
+            raise OSError("inotify is only supported on Linux")
+        self.libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        # Watch descriptor -> directory
+        self.watches = {}
+
+    def add(self, path):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), watch_mask)
+        if wd >= 0:
+            self.watches[wd] = path
+
+    # Waits up to timeout seconds and returns the events as (directory, mask, name).
+    def read(self, timeout):
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        data = os.read(self.fd, 65536)
+        events = []
+        i = 0
+        while i < len(data):
+            wd, mask, cookie, length = struct.unpack_from('iIII', data, i)
+            name = os.fsdecode(data[i + 16:i + 16 + length].rstrip(b'\0'))
+            events.append((self.watches.get(wd), mask, name))
+            i += 16 + length
+
+        return events
+
+## Fallback for systems without inotify, every wake up rescans the watched folder.
+class Poller:
+    def __init__(self, poll_seconds):
+        self.poll_seconds = poll_seconds
+
+    def add(self, path):
+        pass
+
+    def read(self, timeout):
+        time.sleep(min(timeout, self.poll_seconds))
+        return []
+
+## Watches an incoming folder and yields each release directory once it has finished landing.
+# A release is complete once its file count, total size and newest mtime haven't changed for settle_seconds,
+# it contains audio files and the cover (if require_cover, and a .log if require_log), and no partial files are left.
+# Releases are only yielded once per signature, a failed release is picked up again after it's modified
+# or its override file (<override_directory>/<release folder>.json) is written.
+class ReleaseWatcher:
+    def __init__(self, folder, cover_name, settle_seconds=30, require_log=False, poll_seconds=10,
+                 idle_seconds=600, state_file='cache/watched.json', override_directory=None, require_cover=True):
+        self.folder = folder
+        self.override_directory = override_directory
+        self.cover_name = cover_name
+        self.require_cover = require_cover
+        self.settle_seconds = settle_seconds
+        self.require_log = require_log
+        self.idle_seconds = idle_seconds
+        self.state_file = state_file
+        try:
+            self.notifier = Inotify()
+            self.polling = False
+        except (OSError, AttributeError):
+            self.notifier = Poller(poll_seconds)
+            self.polling = True
+        try:
+            with open(state_file) as f:
+                self.done = {path: tuple(signature) for path, signature in json.load(f).items()}
+        except (FileNotFoundError, ValueError):
+            self.done = {}
+
+    def savestate(self):
+        if os.path.dirname(self.state_file):
+            os.makedirs(os.path.dirname(self.state_file), exist_ok=True)
+        with open(f"{self.state_file}.tmp", 'w') as f:
+            json.dump(self.done, f)
+        os.replace(f"{self.state_file}.tmp", self.state_file)
+
+    ## Returns (file count, total size, newest mtime) of a release or None if it no longer exists.
+    # The mtime of the release's override file is appended when it has one.
+    def signature(self, path):
+        try:
+            files = manifest.scan(path).files
+        except (FileNotFoundError, NotADirectoryError):
+            # Removed while we were looking, files removed during the scan are picked up on the next event.
+            return None
+        signature = (len(files), sum(file.size for file in files), max((file.mtime for file in files), default=0))
+        if self.override_directory:
+            try:
+                signature += (os.stat(resolve.overridepath(self.override_directory, path)).st_mtime_ns,)
+            except FileNotFoundError:
+                pass
+
+        return signature
+
+    def iscomplete(self, path):
+        files = [file.relpath.lower() for file in manifest.scan(path).files]
+        if any(file.endswith(partial_extensions) for file in files):
+            return False
+        if not any(file.endswith(('.flac', '.mp3')) for file in files):
+            return False
+        if self.require_log and not any(file.endswith('.log') for file in files):
+            return False
+
+        return not self.require_cover or os.path.exists(os.path.join(path, self.cover_name))
+
+    # Adds watches for a directory and everything below it.
+    def watch(self, path):
+        for root, dirs, files in os.walk(path):
+            self.notifier.add(root)
+
+    # Maps a changed path to the release directory (first level below the watched folder) it belongs to.
+    def releasedir(self, path):
+        if self.override_directory and os.path.dirname(path) == self.override_directory:
+            release = os.path.join(self.folder, os.path.basename(path)[:-len('.json')])
+            return release if path.endswith('.json') and os.path.isdir(release) else None
+        relative = os.path.relpath(path, self.folder)
+        if relative == '.' or relative.startswith('..'):
+            return None
+
+        return os.path.join(self.folder, relative.split(os.sep)[0])
+
+    def subdirectories(self):
+        return [entry.path for entry in os.scandir(self.folder) if entry.is_dir()]
+
+    ## Generator yielding complete releases, idle() is called every idle_seconds to keep the login session warm.
+    def releases(self, idle=None):
+        self.watch(self.folder)
+        if self.override_directory:
+            os.makedirs(self.override_directory, exist_ok=True)
+            self.notifier.add(self.override_directory)
+        # Release directory -> (last signature, time it was first seen with that signature)
+        pending = {path: (None, 0) for path in self.subdirectories()}
+        last_idle = time.time()
+
+        while True:
+            timeout = self.settle_seconds if pending else self.idle_seconds
+            events = self.notifier.read(timeout)
+            for directory, mask, name in events:
+                if directory == None:
+                    continue
+                path = os.path.join(directory, name)
+                if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                    self.watch(path)
+                release = self.releasedir(path)
+                if release:
+                    pending.setdefault(release, (None, 0))
+            if self.polling:
+                for path in self.subdirectories():
+                    pending.setdefault(path, (None, 0))
+
+            now = time.time()
+            if idle and now - last_idle >= self.idle_seconds:
+                idle()
+                last_idle = now
+
+            for path in list(pending):
+                signature = self.signature(path)
+                if signature == None or self.done.get(path) == signature:
+                    del pending[path]
+                elif signature != pending[path][0]:
+                    pending[path] = (signature, now)
+                elif now - pending[path][1] >= self.settle_seconds and self.iscomplete(path):
+                    del pending[path]
+                    self.done[path] = signature
+                    self.savestate()
+                    yield path